@@ -1,7 +1,14 @@
 import datetime as dt
 import sys
 
-from pricing import build_quote, compute_costs, fetch_job_types, get_defaults, parse_pct
+from pricing import (
+    build_quote,
+    clear_material_costs_cache,
+    compute_costs,
+    fetch_job_types,
+    get_defaults,
+    parse_pct,
+)
 
 
 def prompt(text, default=None, validator=None):
@@ -18,88 +25,9 @@ def prompt(text, default=None, validator=None):
             print(f"Invalid value: {exc}")
 
 
-def fetch_job_types(api_url):
-    url = f"{api_url.rstrip('/')}/job-types"
-    try:
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            payload = resp.read().decode("utf-8")
-            data = json.loads(payload)
-        return data
-    except Exception:
-        return None
-
-
-def bom_estimate(api_url, job_type, quantity):
-    url = f"{api_url.rstrip('/')}/estimate"
-    data = json.dumps({"job_type": job_type, "quantity": quantity}).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            payload = resp.read().decode("utf-8")
-            return json.loads(payload)
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8")
-        raise RuntimeError(f"BOM API error {exc.code}: {detail}")
-    except urllib.error.URLError as exc:
-        raise RuntimeError(f"Cannot reach BOM API at {url}: {exc}")
-
-
-def load_material_costs(db_path, names):
-    if not names:
-        return {}
-    placeholders = ",".join("?" for _ in names)
-    query = f"SELECT name, unit, unit_cost, currency FROM materials WHERE name IN ({placeholders})"
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(query, list(names)).fetchall()
-    return {row["name"]: dict(row) for row in rows}
-
-
-def convert_qty(qty, from_unit, to_unit):
-    if from_unit == to_unit:
-        return qty
-    if from_unit == "g" and to_unit == "kg":
-        return qty * 0.001
-    if from_unit == "kg" and to_unit == "g":
-        return qty * 1000
-    if from_unit == "ml" and to_unit == "L":
-        return qty / 1000.0
-    if from_unit == "L" and to_unit == "ml":
-        return qty * 1000.0
-    raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
-
-
-def unit_cost_for_bom(unit_cost_db, bom_unit, db_unit):
-    factor = convert_qty(1, bom_unit, db_unit)
-    return unit_cost_db * factor
-
-
-def render_template(template_text, data):
-    section_pattern = re.compile(r"{{#lines}}(.*?){{/lines}}", re.S)
-
-    def replace_vars(text, context):
-        for key, value in context.items():
-            text = text.replace(f"{{{{{key}}}}}", str(value))
-        return text
-
-    def render_section(match):
-        block = match.group(1)
-        lines_out = []
-        for line in data.get("lines", []):
-            merged = {**data, **line}
-            lines_out.append(replace_vars(block, merged))
-        return "".join(lines_out)
-
-    rendered = section_pattern.sub(render_section, template_text)
-    rendered = replace_vars(rendered, data)
-    return rendered
-
-
-def fmt_money(value):
-    return f"{value:.2f}"
-
-
 def main():
+    if "--refresh-costs" in sys.argv[1:]:
+        clear_material_costs_cache()
     defaults = get_defaults()
     print("Bakery Quotation Agent")
     job_types = fetch_job_types(defaults["bom_api_url"]) or ["cupcakes", "cake", "pastry_box"]
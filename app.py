@@ -1,8 +1,15 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, validator
+import functools
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Literal
 
-app = FastAPI(title="Bakery BOM/Estimation API", version="1.0.0")
+app = FastAPI(
+    title="Bakery BOM/Estimation API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 
 JobType = Literal["cupcakes", "cake", "pastry_box"]
 
@@ -10,23 +17,32 @@ class EstimateRequest(BaseModel):
     job_type: JobType
     quantity: int = Field(..., gt=0)
 
-    @validator("quantity")
-    def _qpos(cls, v):
-        if v <= 0:
-            raise ValueError("quantity must be > 0")
-        return v
+# Largest batch accepted by /batch-estimate.
+BATCH_LIMIT = 100
+
+class BatchEstimateRequest(BaseModel):
+    items: List[EstimateRequest] = Field(..., min_length=1, max_length=BATCH_LIMIT)
 
 class Material(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     name: str
     unit: Literal["kg", "L", "ml", "each"]
     qty: float
 
 class EstimateResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     job_type: JobType
     quantity: int
     materials: List[Material]
     labor_hours: float
 
+class BatchEstimateResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    results: List[EstimateResponse]
+
 
 # --- Fixed per-unit BOMs (units chosen to match your SQL costs) ---
 
@@ -73,21 +89,35 @@ BOM_PER_UNIT: Dict[JobType, Dict] = {
     },
 }
 
+# Keep more precision internally; round kg/L to 3 decimals for readability.
+# ml and eggs/each (which can be halves) keep one decimal.
+ROUND_DECIMALS: Dict[str, int] = {"kg": 3, "L": 3, "ml": 1, "each": 1}
+
+# Flatten BOM_PER_UNIT into (name, unit, qty, decimals) rows per job type so
+# scaling is a single multiply-and-round per material.
+def compile_bom():
+    return {
+        job_type: tuple(
+            (m["name"], m["unit"], m["qty"], ROUND_DECIMALS[m["unit"]])
+            for m in per_unit["materials"]
+        )
+        for job_type, per_unit in BOM_PER_UNIT.items()
+    }
+
+_BOM_COMPILED = compile_bom()
+_JOB_TYPES = tuple(BOM_PER_UNIT)
+
+# Responses are fully determined by (job_type, quantity), and FastAPI only
+# serializes them, so repeat quantities can share one instance.
+@functools.lru_cache(maxsize=512)
 def scale_bom(job_type: JobType, quantity: int) -> EstimateResponse:
-    per_unit = BOM_PER_UNIT[job_type]
-    scaled_materials = []
-    for m in per_unit["materials"]:
-        scaled_qty = m["qty"] * quantity
-        # Keep more precision internally; round to 3 decimals for readability (optional)
-        if m["unit"] in ("kg", "L"):
-            scaled_qty = round(scaled_qty, 3)
-        elif m["unit"] == "ml":
-            scaled_qty = round(scaled_qty, 1)
-        else:  # eggs/each can be halves; keep one decimal
-            scaled_qty = round(scaled_qty, 1)
-        scaled_materials.append(Material(**{**m, "qty": scaled_qty}))
-    labor = round(per_unit["labor_hours"] * quantity, 3)
-    return EstimateResponse(
+    scaled_materials = [
+        # Rows come from the trusted BOM constants, so skip re-validation.
+        Material.model_construct(name=name, unit=unit, qty=round(qty * quantity, decimals))
+        for name, unit, qty, decimals in _BOM_COMPILED[job_type]
+    ]
+    labor = round(BOM_PER_UNIT[job_type]["labor_hours"] * quantity, 3)
+    return EstimateResponse.model_construct(
         job_type=job_type,
         quantity=quantity,
         materials=scaled_materials,
@@ -95,15 +125,27 @@ def scale_bom(job_type: JobType, quantity: int) -> EstimateResponse:
     )
 
 @app.get("/job-types", response_model=List[JobType])
-def get_job_types():
-    return list(BOM_PER_UNIT.keys())
+async def get_job_types():
+    return _JOB_TYPES
 
 @app.post("/estimate", response_model=EstimateResponse)
-def estimate(req: EstimateRequest):
-    if req.job_type not in BOM_PER_UNIT:
-        raise HTTPException(status_code=400, detail="Unknown job_type")
+async def estimate(req: EstimateRequest):
+    # job_type is a Literal, so unknown values are rejected with 422 upfront.
     return scale_bom(req.job_type, req.quantity)
 
+@app.post("/batch-estimate", response_model=BatchEstimateResponse)
+async def batch_estimate(req: BatchEstimateRequest):
+    # Results are returned in request order; repeats share scale_bom's cache.
+    return BatchEstimateResponse.model_construct(
+        results=[scale_bom(item.job_type, item.quantity) for item in req.items]
+    )
+
 @app.get("/healthz")
-def healthz():
-    return {"status": "ok"}
\ No newline at end of file
+async def healthz():
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
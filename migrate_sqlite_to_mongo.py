@@ -1,20 +1,23 @@
+import itertools
 import os
+import re
 import sqlite3
 
+BATCH_SIZE = 1000
+
+
+# KEY=value lines; comment lines never match because keys can't start with "#".
+_ENV_RE = re.compile(r"^[ \t]*([^#\s=][^=\n]*?)[ \t]*=(.*)$", re.M)
+
 
 def load_dotenv(path=".env"):
     if not os.path.exists(path):
         return
     with open(path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.strip()
-            if not line or line.startswith("#") or "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key = key.strip()
-            value = value.strip().strip("'").strip('"')
-            if key:
-                os.environ[key] = value
+        text = f.read()
+    os.environ.update(
+        (m.group(1), m.group(2).strip().strip("'").strip('"')) for m in _ENV_RE.finditer(text)
+    )
 
 
 def get_mongo_collection():
@@ -31,19 +34,32 @@ def get_mongo_collection():
     return client[db_name][collection_name]
 
 
+def upsert_materials(coll, docs):
+    from pymongo import UpdateOne
+
+    ops = (UpdateOne({"name": doc["name"]}, {"$set": doc}, upsert=True) for doc in docs)
+    total = 0
+    while True:
+        batch = list(itertools.islice(ops, BATCH_SIZE))
+        if not batch:
+            return total
+        coll.bulk_write(batch, ordered=False)
+        total += len(batch)
+
+
 def main():
     load_dotenv()
     db_path = os.environ.get("MATERIALS_DB_PATH", os.path.join("Context", "materials.sqlite"))
     if not os.path.exists(db_path):
         raise RuntimeError(f"SQLite DB not found at {db_path}")
     coll = get_mongo_collection()
+    # Lookups and upserts all filter on name.
+    coll.create_index("name")
     with sqlite3.connect(db_path) as conn:
         conn.row_factory = sqlite3.Row
-        rows = conn.execute("SELECT name, unit, unit_cost, currency FROM materials").fetchall()
-    for row in rows:
-        doc = dict(row)
-        coll.update_one({"name": doc["name"]}, {"$set": doc}, upsert=True)
-    print(f"Migrated {len(rows)} materials to MongoDB.")
+        rows = conn.execute("SELECT name, unit, unit_cost, currency FROM materials")
+        count = upsert_materials(coll, (dict(row) for row in rows))
+    print(f"Migrated {count} materials to MongoDB.")
 
 
 if __name__ == "__main__":
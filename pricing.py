@@ -1,16 +1,24 @@
+import concurrent.futures
 import datetime as dt
 import email.message
-import json
+import functools
+import hashlib
 import os
 import re
 import sqlite3
 import smtplib
-import urllib.error
-import urllib.request
+import threading
+import time
+import zipfile
+from collections import ChainMap
+
+import urllib3
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen import canvas
 
+from serialization import dumps, loads
+
 
 DEFAULTS = {
     "labor_rate": 15.00,
@@ -25,21 +33,38 @@ DEFAULTS = {
 }
 
 _MONGO_CLIENT = None
+# Only the fields the pricing code reads; keeps _id and extras off the wire.
+_MATERIAL_PROJECTION = {"_id": 0, "name": 1, "unit": 1, "unit_cost": 1, "currency": 1}
+_HTTP_POOL = None
+_SQLITE_CONNS = {}
+_SQLITE_LOCK = threading.Lock()
+_TEMPLATE_CACHE = {}
+_RENDERED_QUOTES = {}
+_RENDERED_QUOTES_MAX = 256
+_RENDERED_QUOTES_LOCK = threading.Lock()
+_SHEETS_SERVICES = {}
+_SHEETS_HEADER_CHECKED = set()
+_SHEETS_LOCK = threading.Lock()
+_SMTP_IDLE = {}
+_SMTP_LOCK = threading.Lock()
+_SMTP_MAX_IDLE = 2
+_SMTP_NOOP_AFTER = 60
+BATCH_ESTIMATE_LIMIT = 100
+_IO_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="pricing-io")
+
+
+# KEY=value lines; comment lines never match because keys can't start with "#".
+_ENV_RE = re.compile(r"^[ \t]*([^#\s=][^=\n]*?)[ \t]*=(.*)$", re.M)
 
 
 def load_dotenv(path=".env"):
     if not os.path.exists(path):
         return
     with open(path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.strip()
-            if not line or line.startswith("#") or "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key = key.strip()
-            value = value.strip().strip("'").strip('"')
-            if key:
-                os.environ[key] = value
+        text = f.read()
+    os.environ.update(
+        (m.group(1), m.group(2).strip().strip("'").strip('"')) for m in _ENV_RE.finditer(text)
+    )
 
 
 load_dotenv()
@@ -76,6 +101,10 @@ def parse_pct(value):
     return value / 100.0
 
 
+# Settings are read from the environment once per process; call
+# <fn>.cache_clear() after changing os.environ (e.g. in tests), or
+# reload_settings() to pick up an edited .env.
+@functools.lru_cache(maxsize=1)
 def get_defaults():
     return {
         "labor_rate": env_float("LABOR_RATE", DEFAULTS["labor_rate"]),
@@ -91,6 +120,62 @@ def get_defaults():
     }
 
 
+def reload_settings():
+    load_dotenv()
+    for cached in (get_defaults, smtp_settings, sheets_settings, load_fx_rates):
+        cached.cache_clear()
+    # New credentials or tabs take effect on the next append. Not under
+    # _SHEETS_LOCK: an append in flight may hold it for a network round trip,
+    # and clearing a dict/set is atomic.
+    _SHEETS_SERVICES.clear()
+    _SHEETS_HEADER_CHECKED.clear()
+
+
+def ttl_cache(ttl, maxsize=256):
+    # Memoize by arguments for `ttl` seconds. None results (failed upstream
+    # calls) are not stored, and results are shared, so treat them as
+    # read-only.
+    def decorator(func):
+        entries = {}
+        lock = threading.Lock()
+        generation = [0]
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                hit = entries.get(args)
+                gen = generation[0]
+            if hit is not None and hit[0] > now:
+                return hit[1]
+            value = func(*args)
+            if value is None:
+                return value
+            with lock:
+                # Drop the result if cache_clear ran while it was computed.
+                if gen == generation[0]:
+                    if len(entries) >= maxsize:
+                        for key in [k for k, (expires, _) in entries.items() if expires <= now]:
+                            del entries[key]
+                        if len(entries) >= maxsize:
+                            del entries[next(iter(entries))]
+                    entries[args] = (now + ttl, value)
+            return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+                generation[0] += 1
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
+# Rates are re-read at most every five minutes per process instead of on
+# every chat turn and quote (the live path keeps its own file cache too).
+@ttl_cache(ttl=300)
 def load_fx_rates():
     if os.environ.get("FX_LIVE", "").lower() in ("1", "true", "yes", "on"):
         base = env_str("FX_BASE", DEFAULTS["currency"]).upper()
@@ -112,28 +197,33 @@ def load_fx_rates():
         print("[fx] no rates configured; FX conversion disabled")
         return {}
     try:
-        data = json.loads(raw)
+        data = loads(raw)
         rates = {k.upper(): float(v) for k, v in data.items()}
         print("[fx] using rates from FX_RATES_JSON")
         return rates
-    except (ValueError, TypeError, json.JSONDecodeError):
+    except (ValueError, TypeError):
         raise ValueError("FX_RATES_JSON must be valid JSON mapping currency -> rate")
 
 
 def load_fx_cache(path, base, max_age_seconds):
-    if not path or max_age_seconds <= 0 or not os.path.exists(path):
+    if not path or max_age_seconds <= 0:
         return None
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            payload = json.load(f)
+        # The file is rewritten on every save, so an old mtime means a stale
+        # cache; skip reading and parsing it.
+        if time.time() - os.stat(path).st_mtime > max_age_seconds:
+            return None
+        with open(path, "rb") as f:
+            payload = loads(f.read())
         if payload.get("base", "").upper() != base:
             return None
         timestamp = int(payload.get("timestamp", 0))
         if (dt.datetime.utcnow().timestamp() - timestamp) > max_age_seconds:
             return None
-        rates = payload.get("rates", {})
-        return {k.upper(): float(v) for k, v in rates.items()}
-    except (OSError, ValueError, TypeError, json.JSONDecodeError):
+        # save_fx_cache only stores rates already normalized by fetch_fx_rates.
+        rates = payload.get("rates")
+        return rates if isinstance(rates, dict) else None
+    except (OSError, ValueError, TypeError):
         return None
 
 
@@ -146,15 +236,16 @@ def save_fx_cache(path, base, rates):
         "timestamp": int(dt.datetime.utcnow().timestamp()),
         "rates": rates,
     }
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f)
+    with open(path, "wb") as f:
+        f.write(dumps(payload))
 
 
 def fetch_fx_rates(api_url, base):
     try:
-        with urllib.request.urlopen(api_url, timeout=8) as resp:
-            payload = resp.read().decode("utf-8")
-        data = json.loads(payload)
+        resp = http_pool().request("GET", api_url, timeout=8)
+        if resp.status >= 400:
+            return {}
+        data = loads(resp.data)
         rates = data.get("rates") or {}
         if not isinstance(rates, dict):
             return {}
@@ -176,6 +267,7 @@ def convert_currency(amount, from_currency, to_currency, rates):
     return amount * (rates[to_cur] / rates[from_cur])
 
 
+@functools.lru_cache(maxsize=1)
 def smtp_settings():
     host = os.environ.get("SMTP_HOST", "").strip()
     if not host:
@@ -197,6 +289,7 @@ def smtp_settings():
     }
 
 
+@functools.lru_cache(maxsize=1)
 def sheets_settings():
     sheet_id = os.environ.get("SHEET_ID", "").strip()
     if not sheet_id:
@@ -210,32 +303,85 @@ def sheets_settings():
     return {"sheet_id": sheet_id, "tab": tab, "creds_path": creds_path}
 
 
+def http_pool():
+    global _HTTP_POOL
+    if _HTTP_POOL is None:
+        # Keep-alive pool shared by all upstream calls. Failed connects are
+        # retried, but a request the server may have seen is never replayed.
+        _HTTP_POOL = urllib3.PoolManager(
+            num_pools=8,
+            maxsize=10,
+            retries=urllib3.Retry(connect=2, read=0, redirect=3),
+        )
+    return _HTTP_POOL
+
+
+@ttl_cache(ttl=30)
 def fetch_job_types(api_url):
     url = f"{api_url.rstrip('/')}/job-types"
     try:
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            payload = resp.read().decode("utf-8")
-            data = json.loads(payload)
-        return data
+        resp = http_pool().request("GET", url, timeout=5)
+        if resp.status >= 400:
+            return None
+        return loads(resp.data)
     except Exception:
         return None
 
 
+def _estimate_body(job_type, quantity):
+    # Job types are plain identifiers, so the fixed-shape body can be built
+    # directly; anything unusual still goes through the JSON encoder.
+    if type(quantity) is int and job_type.isascii() and job_type.isidentifier():
+        return b'{"job_type":"' + job_type.encode() + b'","quantity":' + str(quantity).encode() + b"}"
+    return dumps({"job_type": job_type, "quantity": quantity})
+
+
+@ttl_cache(ttl=10)
 def bom_estimate(api_url, job_type, quantity):
     url = f"{api_url.rstrip('/')}/estimate"
-    data = json.dumps({"job_type": job_type, "quantity": quantity}).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    data = _estimate_body(job_type, quantity)
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            payload = resp.read().decode("utf-8")
-            return json.loads(payload)
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8")
-        raise RuntimeError(f"BOM API error {exc.code}: {detail}")
-    except urllib.error.URLError as exc:
+        resp = http_pool().request(
+            "POST",
+            url,
+            body=data,
+            headers={"Content-Type": "application/json"},
+            timeout=10,
+        )
+    except urllib3.exceptions.HTTPError as exc:
         raise RuntimeError(f"Cannot reach BOM API at {url}: {exc}")
+    if resp.status >= 400:
+        detail = resp.data.decode("utf-8")
+        raise RuntimeError(f"BOM API error {resp.status}: {detail}")
+    return loads(resp.data)
+
+
+def bom_estimate_batch(api_url, items):
+    # items are (job_type, quantity) pairs; the API caps a batch at
+    # BATCH_ESTIMATE_LIMIT, so larger lists are sent in chunks.
+    url = f"{api_url.rstrip('/')}/batch-estimate"
+    results = []
+    for start in range(0, len(items), BATCH_ESTIMATE_LIMIT):
+        chunk = items[start:start + BATCH_ESTIMATE_LIMIT]
+        data = dumps({"items": [{"job_type": j, "quantity": q} for j, q in chunk]})
+        try:
+            resp = http_pool().request(
+                "POST",
+                url,
+                body=data,
+                headers={"Content-Type": "application/json"},
+                timeout=30,
+            )
+        except urllib3.exceptions.HTTPError as exc:
+            raise RuntimeError(f"Cannot reach BOM API at {url}: {exc}")
+        if resp.status >= 400:
+            detail = resp.data.decode("utf-8")
+            raise RuntimeError(f"BOM API error {resp.status}: {detail}")
+        results.extend(loads(resp.data)["results"])
+    return results
 
 
+@functools.lru_cache(maxsize=1)
 def mongo_settings():
     uri = os.environ.get("MONGODB_URI", "").strip()
     if not uri:
@@ -258,66 +404,105 @@ def mongo_collection():
             from pymongo import MongoClient
         except ImportError as exc:
             raise RuntimeError("pymongo is required when MONGODB_URI is set") from exc
-        _MONGO_CLIENT = MongoClient(settings["uri"])
+        _MONGO_CLIENT = MongoClient(
+            settings["uri"],
+            maxPoolSize=50,
+            minPoolSize=5,
+            connectTimeoutMS=2000,
+            socketTimeoutMS=5000,
+            serverSelectionTimeoutMS=5000,
+        )
     return _MONGO_CLIENT[settings["db"]][settings["collection"]]
 
 
+def sqlite_connection(db_path):
+    # One long-lived connection per DB file, shared by reads and cost updates;
+    # callers hold _SQLITE_LOCK while using it since request threads share it.
+    conn = _SQLITE_CONNS.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=128)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers in other processes (the UI and agent share the
+        # file) proceed during a cost update; NORMAL sync is safe under WAL.
+        # Opt-in: WAL is a persistent change to the file and adds -wal/-shm
+        # files, and it fails on read-only mounts, where the default rollback
+        # journal is kept.
+        if os.environ.get("SQLITE_WAL", "").lower() in ("1", "true", "yes", "on"):
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+            except sqlite3.OperationalError as exc:
+                print(f"[sqlite] WAL not enabled for {db_path}: {exc}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -20000")
+        _SQLITE_CONNS[db_path] = conn
+    return conn
+
+
+def materials_db_stamp(db_path):
+    # Cheap change marker for the SQLite file: committed writes land in the
+    # -wal file until a checkpoint, so both mtimes count. None under MongoDB.
+    if mongo_settings():
+        return None
+    stamp = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+@functools.lru_cache(maxsize=32)
+def _material_costs_query(count):
+    placeholders = ",".join("?" * count)
+    return f"SELECT name, unit, unit_cost, currency FROM materials WHERE name IN ({placeholders})"
+
+
 def load_material_costs(db_path, names):
     if not names:
         return {}
+    # The catalog changes rarely and quotes draw from a small set of names, so
+    # repeat lookups are served from memory. Local cost updates clear the
+    # cache; changes made elsewhere (other workers/instances, the migration
+    # script, a sqlite shell) show up once the entry expires.
+    return dict(_cached_material_costs(db_path, frozenset(names)))
+
+
+def clear_material_costs_cache():
+    _cached_material_costs.cache_clear()
+    list_materials.cache_clear()
+
+
+@ttl_cache(ttl=60, maxsize=128)
+def _cached_material_costs(db_path, names):
     coll = mongo_collection()
     if coll is not None:
-        docs = coll.find({"name": {"$in": list(names)}})
-        return {
-            doc["name"]: {
-                "name": doc["name"],
-                "unit": doc["unit"],
-                "unit_cost": doc["unit_cost"],
-                "currency": doc["currency"],
-            }
-            for doc in docs
-        }
-    placeholders = ",".join("?" for _ in names)
-    query = f"SELECT name, unit, unit_cost, currency FROM materials WHERE name IN ({placeholders})"
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(query, list(names)).fetchall()
-    return {row["name"]: dict(row) for row in rows}
+        docs = coll.find({"name": {"$in": list(names)}}, _MATERIAL_PROJECTION)
+        return {doc["name"]: doc for doc in docs}
+    query = _material_costs_query(len(names))
+    with _SQLITE_LOCK:
+        conn = sqlite_connection(db_path)
+        return {row["name"]: dict(row) for row in conn.execute(query, list(names))}
 
 
+@ttl_cache(ttl=60)
 def list_materials(db_path):
     coll = mongo_collection()
     if coll is not None:
-        docs = coll.find().sort("name", 1)
-        return [
-            {
-                "name": doc["name"],
-                "unit": doc["unit"],
-                "unit_cost": doc["unit_cost"],
-                "currency": doc["currency"],
-            }
-            for doc in docs
-        ]
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("SELECT name, unit, unit_cost, currency FROM materials ORDER BY name").fetchall()
-    return [dict(row) for row in rows]
+        return list(coll.find({}, _MATERIAL_PROJECTION).sort("name", 1))
+    with _SQLITE_LOCK:
+        conn = sqlite_connection(db_path)
+        rows = conn.execute("SELECT name, unit, unit_cost, currency FROM materials ORDER BY name")
+        return [dict(row) for row in rows]
 
 
 def get_material(db_path, name):
     coll = mongo_collection()
     if coll is not None:
-        doc = coll.find_one({"name": name})
-        if not doc:
-            return None
-        return {
-            "name": doc["name"],
-            "unit": doc["unit"],
-            "unit_cost": doc["unit_cost"],
-            "currency": doc["currency"],
-        }
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
+        return coll.find_one({"name": name}, _MATERIAL_PROJECTION)
+    with _SQLITE_LOCK:
+        conn = sqlite_connection(db_path)
         row = conn.execute(
             "SELECT name, unit, unit_cost, currency FROM materials WHERE name = ?",
             (name,),
@@ -326,32 +511,67 @@ def get_material(db_path, name):
 
 
 def update_material_cost(db_path, name, unit_cost):
+    update_material_costs(db_path, [(name, unit_cost)])
+
+
+def update_material_costs(db_path, items):
+    # items are (name, unit_cost) pairs, applied in one round-trip/transaction.
+    items = list(items)
+    if not items:
+        return
+    # Unknown names are rejected before anything is written.
+    names = sorted({name for name, _ in items})
     coll = mongo_collection()
     if coll is not None:
-        result = coll.update_one({"name": name}, {"$set": {"unit_cost": unit_cost}})
-        if result.matched_count == 0:
-            raise ValueError("Material not found")
-        return
-    with sqlite3.connect(db_path) as conn:
-        conn.execute(
-            "UPDATE materials SET unit_cost = ? WHERE name = ?",
-            (unit_cost, name),
+        from pymongo import UpdateOne
+
+        missing = set(names) - set(coll.distinct("name", {"name": {"$in": names}}))
+        if missing:
+            raise ValueError(f"Material not found: {', '.join(sorted(missing))}")
+        result = coll.bulk_write(
+            [UpdateOne({"name": name}, {"$set": {"unit_cost": unit_cost}}) for name, unit_cost in items],
+            ordered=False,
         )
-        conn.commit()
+        clear_material_costs_cache()
+        if result.matched_count < len(items):
+            # Removed between the check and the write; the rest is saved.
+            raise ValueError("Material not found (other costs were saved)")
+        return
+    with _SQLITE_LOCK:
+        conn = sqlite_connection(db_path)
+        with conn:
+            found = {
+                row[0]
+                for row in conn.execute(
+                    f"SELECT name FROM materials WHERE name IN ({', '.join('?' * len(names))})",
+                    names,
+                )
+            }
+            missing = set(names) - found
+            if missing:
+                raise ValueError(f"Material not found: {', '.join(sorted(missing))}")
+            conn.executemany(
+                "UPDATE materials SET unit_cost = ? WHERE name = ?",
+                [(unit_cost, name) for name, unit_cost in items],
+            )
+    clear_material_costs_cache()
+
+
+_QTY_FACTORS = {
+    ("g", "kg"): 0.001,
+    ("kg", "g"): 1000.0,
+    ("ml", "L"): 0.001,
+    ("L", "ml"): 1000.0,
+}
 
 
 def convert_qty(qty, from_unit, to_unit):
     if from_unit == to_unit:
         return qty
-    if from_unit == "g" and to_unit == "kg":
-        return qty * 0.001
-    if from_unit == "kg" and to_unit == "g":
-        return qty * 1000
-    if from_unit == "ml" and to_unit == "L":
-        return qty / 1000.0
-    if from_unit == "L" and to_unit == "ml":
-        return qty * 1000.0
-    raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    factor = _QTY_FACTORS.get((from_unit, to_unit))
+    if factor is None:
+        raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    return qty * factor
 
 
 def unit_cost_for_bom(unit_cost_db, bom_unit, db_unit):
@@ -359,29 +579,49 @@ def unit_cost_for_bom(unit_cost_db, bom_unit, db_unit):
     return unit_cost_db * factor
 
 
+_SECTION_RE = re.compile(r"{{#lines}}(.*?){{/lines}}", re.S)
+_VAR_RE = re.compile(r"{{(\w+)}}")
+# Drops ** markers and a leading heading marker in one pass; the heading
+# branch also absorbs ** mixed into the prefix, as stripping ** first would.
+_MD_INLINE_RE = re.compile(r"^(?:\*\*)*#(?:#|\*\*)*(?:\s|\*\*)*|\*\*")
+# A table row whose cells are only dashes and/or whitespace.
+_TABLE_SEP_RE = re.compile(r"\|(?:\s*-*\s*\|)*")
+
+
 def render_template(template_text, data):
-    section_pattern = re.compile(r"{{#lines}}(.*?){{/lines}}", re.S)
+    if "{{" not in template_text:
+        return template_text
 
     def replace_vars(text, context):
-        for key, value in context.items():
-            text = text.replace(f"{{{{{key}}}}}", str(value))
-        return text
+        # One scan over the text; placeholders without a value are left as-is.
+        return _VAR_RE.sub(
+            lambda m: str(context[m.group(1)]) if m.group(1) in context else m.group(0),
+            text,
+        )
 
     def render_section(match):
-        block = match.group(1)
+        # Split the block once into literal text and placeholder names, then
+        # fill the slots for each line; ChainMap avoids a merged dict per line.
+        parts = _VAR_RE.split(match.group(1))
+        literals, keys = parts[0::2], parts[1::2]
         lines_out = []
         for line in data.get("lines", []):
-            merged = {**data, **line}
-            lines_out.append(replace_vars(block, merged))
+            context = ChainMap(line, data)
+            lines_out.append(literals[0])
+            for key, literal in zip(keys, literals[1:]):
+                lines_out.append(str(context[key]) if key in context else f"{{{{{key}}}}}")
+                lines_out.append(literal)
         return "".join(lines_out)
 
-    rendered = section_pattern.sub(render_section, template_text)
+    rendered = template_text
+    if "{{#lines}}" in rendered:
+        rendered = _SECTION_RE.sub(render_section, rendered)
     rendered = replace_vars(rendered, data)
     return rendered
 
 
-def fmt_money(value):
-    return f"{value:.2f}"
+# Bound %-formatting skips format-spec parsing and a Python call frame.
+fmt_money = "%.2f".__mod__
 
 
 def markdown_to_text(markdown_text):
@@ -389,15 +629,27 @@ def markdown_to_text(markdown_text):
     for raw in markdown_text.splitlines():
         line = raw.strip()
         if line.startswith("|") and line.endswith("|"):
-            parts = [p.strip() for p in line.strip("|").split("|")]
-            if all(set(p) <= {"-"} or p == "" for p in parts):
+            if _TABLE_SEP_RE.fullmatch(line):
                 continue
-            lines.append(" | ".join(parts))
+            lines.append(" | ".join(p.strip() for p in line.strip("|").split("|")))
             continue
-        line = line.replace("**", "")
-        line = re.sub(r"^#+\s*", "", line)
+        if "**" in line or line.startswith("#"):
+            line = _MD_INLINE_RE.sub("", line)
         lines.append(line)
-    return "\n".join(lines).strip() + "\n"
+    # Equivalent to "\n".join(lines).strip() + "\n" without copying the whole
+    # text twice: trim blank edge lines, strip the two edge lines, join once.
+    start, end = 0, len(lines)
+    while start < end and not lines[start].strip():
+        start += 1
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+    if start == end:
+        return "\n"
+    lines = lines[start:end]
+    lines[0] = lines[0].lstrip()
+    lines[-1] = lines[-1].rstrip()
+    lines.append("")
+    return "\n".join(lines)
 
 
 def write_text_version(markdown_text, out_md_path):
@@ -409,6 +661,12 @@ def write_text_version(markdown_text, out_md_path):
     return out_txt
 
 
+@functools.lru_cache(maxsize=4096)
+def _sw(text, font, size):
+    # Font metrics are a pure function of their inputs; words repeat a lot.
+    return pdfmetrics.stringWidth(text, font, size)
+
+
 def write_pdf_version(out_md_path, data, lines):
     base = os.path.splitext(out_md_path)[0]
     out_pdf = f"{base}.pdf"
@@ -424,16 +682,22 @@ def write_pdf_version(out_md_path, data, lines):
         if not line:
             c.drawString(x, y_pos, "")
             return y_pos - line_height
-        words = line.split(" ")
+        # Track the running width word by word instead of re-measuring the
+        # whole joined line on every step.
+        space_w = _sw(" ", font, size)
         current = []
-        for word in words:
-            trial = " ".join(current + [word])
-            if pdfmetrics.stringWidth(trial, font, size) <= max_width:
+        current_w = 0.0
+        for word in line.split(" "):
+            word_w = _sw(word, font, size)
+            trial_w = current_w + space_w + word_w if current else word_w
+            if trial_w <= max_width:
                 current.append(word)
+                current_w = trial_w
             else:
                 c.drawString(margin_x, y_pos, " ".join(current))
                 y_pos -= line_height
                 current = [word]
+                current_w = word_w
         if current:
             c.drawString(margin_x, y_pos, " ".join(current))
             y_pos -= line_height
@@ -531,10 +795,112 @@ def write_pdf_version(out_md_path, data, lines):
     return out_pdf
 
 
+# Attachment MIME types by extension; anything else goes out as text/plain.
+_MIME = {
+    ".md": ("text", "markdown"),
+    ".txt": ("text", "plain"),
+    ".pdf": ("application", "pdf"),
+}
+
+
 def send_quote_email(settings, recipient, subject, body, attachments):
+    send_quote_emails(settings, [(recipient, subject, body, attachments)])
+
+
+def send_quote_emails(settings, messages):
+    # messages are (recipient, subject, body, attachments) tuples, all sent
+    # over one SMTP connection, which is then kept for the next call.
     if not settings or not settings.get("sender"):
         raise ValueError("SMTP settings are missing or incomplete")
 
+    built = [_quote_message(settings, *message) for message in messages]
+    if not built:
+        return
+
+    server, reused = _smtp_checkout(settings)
+    try:
+        try:
+            server.send_message(built[0])
+        except smtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+            # The server dropped the pooled connection; dial once more.
+            server.close()
+            server = _smtp_connect(settings)
+            server.send_message(built[0])
+        for msg in built[1:]:
+            server.send_message(msg)
+    except BaseException:
+        _smtp_close(server)
+        raise
+    _smtp_checkin(settings, server)
+
+
+def _smtp_key(settings):
+    return (
+        settings["host"],
+        settings["port"],
+        settings["user"],
+        settings["password"],
+        settings["use_tls"],
+        settings["use_ssl"],
+    )
+
+
+def _smtp_connect(settings):
+    if settings["use_ssl"]:
+        server = smtplib.SMTP_SSL(settings["host"], settings["port"])
+    else:
+        server = smtplib.SMTP(settings["host"], settings["port"])
+    try:
+        if settings["use_tls"] and not settings["use_ssl"]:
+            server.starttls()
+        if settings["user"] and settings["password"]:
+            server.login(settings["user"], settings["password"])
+    except BaseException:
+        _smtp_close(server)
+        raise
+    return server
+
+
+def _smtp_close(server):
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def _smtp_checkout(settings):
+    # Returns (server, reused). Idle connections save the TLS handshake and
+    # login; ones idle for a while are probed with NOOP before reuse.
+    key = _smtp_key(settings)
+    while True:
+        with _SMTP_LOCK:
+            idle = _SMTP_IDLE.get(key)
+            if not idle:
+                break
+            server, last_used = idle.pop()
+        if time.monotonic() - last_used < _SMTP_NOOP_AFTER:
+            return server, True
+        try:
+            if server.noop()[0] == 250:
+                return server, True
+        except (smtplib.SMTPException, OSError):
+            pass
+        server.close()
+    return _smtp_connect(settings), False
+
+
+def _smtp_checkin(settings, server):
+    with _SMTP_LOCK:
+        idle = _SMTP_IDLE.setdefault(_smtp_key(settings), [])
+        if len(idle) < _SMTP_MAX_IDLE:
+            idle.append((server, time.monotonic()))
+            return
+    _smtp_close(server)
+
+
+def _quote_message(settings, recipient, subject, body, attachments):
     msg = email.message.EmailMessage()
     msg["From"] = settings["sender"]
     msg["To"] = recipient
@@ -545,102 +911,142 @@ def send_quote_email(settings, recipient, subject, body, attachments):
         with open(path, "rb") as f:
             data = f.read()
         filename = os.path.basename(path)
-        maintype = "text"
-        subtype = "plain"
-        if filename.endswith(".md"):
-            subtype = "markdown"
-        if filename.endswith(".pdf"):
-            maintype = "application"
-            subtype = "pdf"
+        maintype, subtype = _MIME.get(os.path.splitext(filename)[1], ("text", "plain"))
         msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+    return msg
 
-    if settings["use_ssl"]:
-        server = smtplib.SMTP_SSL(settings["host"], settings["port"])
-    else:
-        server = smtplib.SMTP(settings["host"], settings["port"])
-    with server:
-        if settings["use_tls"] and not settings["use_ssl"]:
-            server.starttls()
-        if settings["user"] and settings["password"]:
-            server.login(settings["user"], settings["password"])
-        server.send_message(msg)
 
+def sheets_service(creds_path):
+    # Credentials + discovery are built once per service-account file.
+    service = _SHEETS_SERVICES.get(creds_path)
+    if service is None:
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
 
-def append_quote_to_sheet(settings, headers, row):
-    from google.oauth2 import service_account
-    from googleapiclient.discovery import build
+        if not os.path.exists(creds_path):
+            raise ValueError("Service account JSON not found")
+        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+        creds = service_account.Credentials.from_service_account_file(creds_path, scopes=scopes)
+        service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+        _SHEETS_SERVICES[creds_path] = service
+    return service
 
-    if not os.path.exists(settings["creds_path"]):
-        raise ValueError("Service account JSON not found")
 
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = service_account.Credentials.from_service_account_file(
-        settings["creds_path"], scopes=scopes
-    )
-    service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+def _prepare_sheet_locked(settings, headers):
+    # Caller holds _SHEETS_LOCK. Writes the header row once per tab if empty.
     sheet_id = settings["sheet_id"]
     tab = settings["tab"]
+    service = sheets_service(settings["creds_path"])
+    if (sheet_id, tab) not in _SHEETS_HEADER_CHECKED:
+        safe_tab = f"'{tab}'" if " " in tab else tab
+        existing = (
+            service.spreadsheets()
+            .values()
+            .get(spreadsheetId=sheet_id, range=f"{safe_tab}!1:1")
+            .execute()
+        )
+        if not existing.get("values"):
+            service.spreadsheets().values().update(
+                spreadsheetId=sheet_id,
+                range=f"{safe_tab}!1:1",
+                valueInputOption="USER_ENTERED",
+                body={"values": [headers]},
+            ).execute()
+        _SHEETS_HEADER_CHECKED.add((sheet_id, tab))
+    return service
 
+
+def append_quote_to_sheet(settings, headers, row):
+    append_quotes_to_sheet(settings, headers, [row])
+
+
+def append_quotes_to_sheet(settings, headers, rows):
+    if not rows:
+        return
+    sheet_id = settings["sheet_id"]
+    tab = settings["tab"]
     safe_tab = f"'{tab}'" if " " in tab else tab
-    existing = (
-        service.spreadsheets()
-        .values()
-        .get(spreadsheetId=sheet_id, range=f"{safe_tab}!1:1")
-        .execute()
-    )
-    if not existing.get("values"):
-        service.spreadsheets().values().update(
+
+    # The API client is not thread-safe, so appends are serialized.
+    with _SHEETS_LOCK:
+        service = _prepare_sheet_locked(settings, headers)
+        service.spreadsheets().values().append(
             spreadsheetId=sheet_id,
-            range=f"{safe_tab}!1:1",
+            range=f"{safe_tab}!A1",
             valueInputOption="USER_ENTERED",
-            body={"values": [headers]},
+            insertDataOption="INSERT_ROWS",
+            body={"values": rows},
         ).execute()
 
-    service.spreadsheets().values().append(
-        spreadsheetId=sheet_id,
-        range=f"{safe_tab}!A1",
-        valueInputOption="USER_ENTERED",
-        insertDataOption="INSERT_ROWS",
-        body={"values": [row]},
-    ).execute()
-
 
 def compute_costs(inputs, defaults):
-    fx_rates = load_fx_rates()
+    # FX rates and the BOM estimate come from independent upstreams, so fetch
+    # them concurrently: the wait is the slower of the two, not their sum.
+    fx_future = _IO_POOL.submit(load_fx_rates)
     estimate = bom_estimate(defaults["bom_api_url"], inputs["job_type"], inputs["quantity"])
+    fx_rates = fx_future.result()
+    material_names = [m["name"] for m in estimate["materials"]]
+    costs = load_material_costs(defaults["materials_db_path"], material_names)
+    return price_estimate(inputs, defaults, estimate, costs, fx_rates)
+
+
+def compute_costs_batch(inputs_list, defaults):
+    # Several quotes share one FX load, one /batch-estimate call and one
+    # materials query; results come back in input order.
+    if not inputs_list:
+        return []
+    fx_future = _IO_POOL.submit(load_fx_rates)
+    estimates = bom_estimate_batch(
+        defaults["bom_api_url"],
+        [(inputs["job_type"], inputs["quantity"]) for inputs in inputs_list],
+    )
+    fx_rates = fx_future.result()
+    names = {m["name"] for estimate in estimates for m in estimate["materials"]}
+    costs = load_material_costs(defaults["materials_db_path"], names)
+    return [
+        price_estimate(inputs, defaults, estimate, costs, fx_rates)
+        for inputs, estimate in zip(inputs_list, estimates)
+    ]
+
+
+def price_estimate(inputs, defaults, estimate, costs, fx_rates):
     materials = estimate["materials"]
     labor_hours = float(estimate["labor_hours"])
 
     material_names = [m["name"] for m in materials]
-    costs = load_material_costs(defaults["materials_db_path"], material_names)
     missing = [name for name in material_names if name not in costs]
     if missing:
         raise ValueError(f"Missing materials in DB: {', '.join(missing)}")
 
-    lines = []
+    # Scale, cost and format each line in one pass with the hot lookups bound
+    # locally; the list is sized up front since it maps 1:1 onto materials.
+    quote_currency = inputs["currency"]
+    money = fmt_money
+    per_unit = unit_cost_for_bom
+    lines = [None] * len(materials)
     materials_subtotal = 0.0
-    for m in materials:
-        info = costs[m["name"]]
+    for i, m in enumerate(materials):
+        name = m["name"]
+        info = costs[name]
         unit_cost = float(info["unit_cost"])
-        if info["currency"] != inputs["currency"]:
+        if info["currency"] != quote_currency:
             try:
-                unit_cost = convert_currency(unit_cost, info["currency"], inputs["currency"], fx_rates)
+                unit_cost = convert_currency(unit_cost, info["currency"], quote_currency, fx_rates)
             except ValueError as exc:
                 inputs.setdefault("warnings", []).append(
-                    f"{m['name']} priced in {info['currency']} but quote currency is {inputs['currency']}: {exc}"
+                    f"{name} priced in {info['currency']} but quote currency is {quote_currency}: {exc}"
                 )
-        per_unit_cost = unit_cost_for_bom(unit_cost, m["unit"], info["unit"])
-        line_cost = m["qty"] * per_unit_cost
+        qty = m["qty"]
+        per_unit_cost = per_unit(unit_cost, m["unit"], info["unit"])
+        line_cost = qty * per_unit_cost
         materials_subtotal += line_cost
-        lines.append(
-            {
-                "name": m["name"],
-                "qty": m["qty"],
-                "unit": m["unit"],
-                "unit_cost": fmt_money(per_unit_cost),
-                "line_cost": fmt_money(line_cost),
-            }
-        )
+        lines[i] = {
+            "name": name,
+            "qty": qty,
+            "unit": m["unit"],
+            "unit_cost": money(per_unit_cost),
+            "line_cost": money(line_cost),
+        }
 
     base_currency = defaults["currency"]
     if inputs["currency"] != base_currency:
@@ -677,6 +1083,35 @@ def compute_costs(inputs, defaults):
     return lines, summary
 
 
+def _load_template(path):
+    # Re-read the template only when its mtime changes.
+    mtime = os.stat(path).st_mtime_ns
+    cached = _TEMPLATE_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    _TEMPLATE_CACHE[path] = (mtime, text)
+    return text
+
+
+def write_zip_bundle(out_md_path, paths):
+    # All renditions in one download. Stored, not deflated: the text files
+    # are tiny and the PDF is already compressed.
+    out_zip_path = os.path.splitext(out_md_path)[0] + ".zip"
+    with zipfile.ZipFile(out_zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for path in paths:
+            zf.write(path, arcname=os.path.basename(path))
+    return out_zip_path
+
+
+def _file_stamps(paths):
+    try:
+        return tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, paths))
+    except OSError:
+        return None
+
+
 def build_quote(inputs, defaults, lines=None, summary=None):
     if lines is None or summary is None:
         lines, summary = compute_costs(inputs, defaults)
@@ -685,8 +1120,7 @@ def build_quote(inputs, defaults, lines=None, summary=None):
     valid_until = quote_date + dt.timedelta(days=defaults["quote_valid_days"])
     quote_id = f"Q-{quote_date.strftime('%Y%m%d')}-{inputs['quantity']:03d}"
 
-    with open(defaults["template_path"], "r", encoding="utf-8") as f:
-        template_text = f.read()
+    template_text = _load_template(defaults["template_path"])
 
     data = {
         "company_name": inputs["company_name"],
@@ -713,13 +1147,32 @@ def build_quote(inputs, defaults, lines=None, summary=None):
         "notes": f"{inputs['notes']} (Customer email: {inputs['customer_email']})",
     }
 
-    rendered = render_template(template_text, data)
-    os.makedirs(defaults["output_dir"], exist_ok=True)
     out_path = os.path.join(defaults["output_dir"], f"quote_{quote_id}.md")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(rendered)
-    out_txt_path = write_text_version(rendered, out_path)
-    out_pdf_path = write_pdf_version(out_path, data, lines)
+    # Identical data re-renders identical files, so a repeat quote reuses them
+    # as long as nothing has rewritten them since (ids are per day/quantity).
+    key = hashlib.blake2b(dumps([out_path, template_text, data]), digest_size=16).digest()
+    with _RENDERED_QUOTES_LOCK:
+        cached = _RENDERED_QUOTES.get(key)
+    if cached is not None and _file_stamps(cached[1]) == cached[2]:
+        rendered, (out_path, out_txt_path, out_pdf_path, out_zip_path), _ = cached
+    else:
+        rendered = render_template(template_text, data)
+        os.makedirs(defaults["output_dir"], exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(rendered)
+        # The .txt and .pdf renditions are independent; write the text one on
+        # the I/O pool while the PDF is laid out here.
+        txt_future = _IO_POOL.submit(write_text_version, rendered, out_path)
+        out_pdf_path = write_pdf_version(out_path, data, lines)
+        out_txt_path = txt_future.result()
+        out_zip_path = write_zip_bundle(out_path, [out_path, out_txt_path, out_pdf_path])
+        paths = (out_path, out_txt_path, out_pdf_path, out_zip_path)
+        stamps = _file_stamps(paths)
+        if stamps is not None:
+            with _RENDERED_QUOTES_LOCK:
+                if len(_RENDERED_QUOTES) >= _RENDERED_QUOTES_MAX:
+                    _RENDERED_QUOTES.pop(next(iter(_RENDERED_QUOTES)))
+                _RENDERED_QUOTES[key] = (rendered, paths, stamps)
 
     return {
         "quote_id": quote_id,
@@ -728,6 +1181,7 @@ def build_quote(inputs, defaults, lines=None, summary=None):
         "out_path": out_path,
         "out_txt_path": out_txt_path,
         "out_pdf_path": out_pdf_path,
+        "out_zip_path": out_zip_path,
         "markdown": rendered,
         "lines": lines,
         "summary": summary,
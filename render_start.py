@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
+import concurrent.futures
 import os
 import signal
 import subprocess
 import sys
 import threading
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib import error, request
+
+import urllib3
 
 
 UI_PORT = int(os.environ.get("UI_PORT", "8002"))
@@ -24,16 +26,30 @@ HOP_BY_HOP = {
     "host",
 }
 
+# Keep-alive connections to the two local upstreams (one pool per port).
+# Redirects are still followed here as urlopen did; a request the upstream
+# may have seen is never replayed.
+_POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=32,
+    block=False,
+    retries=urllib3.Retry(connect=2, read=0, redirect=5),
+)
+
 
 def upstream_url(path):
     if path.startswith("/api/"):
         return f"http://127.0.0.1:{BOM_PORT}{path[len('/api'):] or '/'}"
-    if path in ("/estimate", "/job-types", "/healthz"):
+    if path in ("/estimate", "/batch-estimate", "/job-types", "/healthz"):
         return f"http://127.0.0.1:{BOM_PORT}{path}"
     return f"http://127.0.0.1:{UI_PORT}{path}"
 
 
 class ProxyHandler(BaseHTTPRequestHandler):
+    # Let browsers reuse their connection across requests. Every response
+    # below is either length-delimited or marked Connection: close.
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self):
         self._proxy()
 
@@ -60,29 +76,57 @@ class ProxyHandler(BaseHTTPRequestHandler):
         length = int(self.headers.get("Content-Length", "0"))
         body = self.rfile.read(length) if length else None
         headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
-        req = request.Request(target, data=body, headers=headers, method=self.command)
+        resp = None
         try:
-            with request.urlopen(req, timeout=30) as resp:
-                self.send_response(resp.status)
-                for key, value in resp.headers.items():
-                    if key.lower() in HOP_BY_HOP:
-                        continue
-                    self.send_header(key, value)
-                self.end_headers()
-                self.wfile.write(resp.read())
-        except error.HTTPError as exc:
-            self.send_response(exc.code)
-            for key, value in exc.headers.items():
+            # decode_content=False passes compressed bodies through untouched,
+            # matching the Content-Encoding header forwarded below.
+            resp = _POOL.request(
+                self.command,
+                target,
+                body=body,
+                headers=headers,
+                timeout=30,
+                decode_content=False,
+                preload_content=False,
+            )
+            self.send_response(resp.status)
+            for key, value in resp.headers.items():
                 if key.lower() in HOP_BY_HOP:
                     continue
                 self.send_header(key, value)
+            if "content-length" not in resp.headers:
+                # Chunked upstream bodies are relayed raw, so end them by close.
+                self.send_header("Connection", "close")
+                self.close_connection = True
             self.end_headers()
-            self.wfile.write(exc.read())
+            # Relay in chunks so large PDFs never sit fully in proxy memory.
+            for chunk in resp.stream(65536, decode_content=False):
+                self.wfile.write(chunk)
         except Exception as exc:
+            if resp is not None:
+                # Headers already went out; all we can do is drop the client.
+                self.close_connection = True
+                return
+            payload = f"Proxy error: {exc}".encode("utf-8")
             self.send_response(502)
             self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
             self.end_headers()
-            self.wfile.write(f"Proxy error: {exc}".encode("utf-8"))
+            self.wfile.write(payload)
+        finally:
+            if resp is not None:
+                resp.release_conn()
+
+
+def wait_for_child_exit(children):
+    if hasattr(os, "waitid"):
+        # WNOWAIT leaves the exit status for Popen to reap as usual.
+        os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOWAIT)
+        return
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(children))
+    futures = [pool.submit(proc.wait) for proc in children]
+    concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+    pool.shutdown(wait=False)
 
 
 def start_child(cmd, env=None):
@@ -100,7 +144,7 @@ def main():
     ui_proc = start_child(ui_cmd, env=env)
     children = [api_proc, ui_proc]
 
-    def shutdown(_signum=None, _frame=None):
+    def stop_children():
         for proc in children:
             if proc.poll() is None:
                 proc.terminate()
@@ -109,22 +153,28 @@ def main():
                 proc.wait(timeout=5)
             except Exception:
                 proc.kill()
+
+    def shutdown(_signum=None, _frame=None):
+        stop_children()
         sys.exit(0)
 
+    server = ThreadingHTTPServer(("0.0.0.0", PROXY_PORT), ProxyHandler)
+
     def monitor():
-        while True:
-            for proc in children:
-                if proc.poll() is not None:
-                    shutdown()
-            threading.Event().wait(1)
+        # Sleep until a child exits, then take the rest down. sys.exit only
+        # ends this thread, so stop the server to unblock the main thread.
+        wait_for_child_exit(children)
+        stop_children()
+        server.shutdown()
 
     signal.signal(signal.SIGTERM, shutdown)
     signal.signal(signal.SIGINT, shutdown)
     threading.Thread(target=monitor, daemon=True).start()
 
-    server = ThreadingHTTPServer(("0.0.0.0", PROXY_PORT), ProxyHandler)
     print(f"Proxy listening on 0.0.0.0:{PROXY_PORT} (UI->{UI_PORT}, BOM->{BOM_PORT})")
     server.serve_forever()
+    # Only reached when a child died; exit non-zero so the platform restarts us.
+    sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+# JSON helpers shared by the pricing/UI code: orjson when installed, stdlib
+# json otherwise. dumps always returns UTF-8 bytes and loads accepts bytes or str.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+    def loads(data):
+        return orjson.loads(data)
+
+else:
+    import json
+
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(data):
+        return json.loads(data)
@@ -1,61 +1,175 @@
+import asyncio
+import collections
 import datetime as dt
+import functools
+import gzip
 import hashlib
 import hmac
 import html
-import json
+import mimetypes
 import os
 import re
-import urllib.error
-import urllib.request
-import os
+import signal
+import stat
+import time
 from typing import List
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from fastapi import FastAPI, Form
+import urllib3
+from fastapi import BackgroundTasks, FastAPI, Form
 from fastapi import Request
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, Response, StreamingResponse
 
 from pricing import (
     build_quote,
+    clear_material_costs_cache,
     compute_costs,
+    env_int,
     fetch_job_types,
     get_defaults,
     get_material,
+    http_pool,
     list_materials,
     parse_pct,
-    append_quote_to_sheet,
+    reload_settings,
+    append_quotes_to_sheet,
     load_fx_rates,
+    materials_db_stamp,
     update_material_cost,
+    update_material_costs,
     send_quote_email,
     sheets_settings,
     smtp_settings,
+    ttl_cache,
+)
+from serialization import JSONDecodeError, dumps, loads
+
+
+app = FastAPI(title="Bakery Quotation UI", default_response_class=ORJSONResponse)
+# Compresses the generated HTML/JSON; responses that already carry a
+# Content-Encoding (the pre-gzipped landing page) pass through untouched.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+# __Host- cookies must be Secure, Path=/ and host-only; browsers enforce it.
+# Over plain HTTP (e.g. docker on a LAN IP) a Secure cookie would be dropped,
+# so the session falls back to an ordinary cookie name there.
+ADMIN_COOKIE_NAME = "__Host-bakery_admin"
+ADMIN_COOKIE_NAME_HTTP = "bakery_admin"
+
+# Patterns used while parsing chat input, compiled once.
+_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_ISO_SEARCH_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_SLASH_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_WORD_DAY_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+([a-zA-Z]+)(?:\s+(\d{2,4}))?\b")
+_WORD_MONTH_RE = re.compile(r"\b([a-zA-Z]+)\s+(\d{1,2})(?:st|nd|rd|th)?(?:\s+(\d{2,4}))?\b")
+_WEEKDAY_RE = re.compile(r"(next\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday)")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_QTY_RE = re.compile(r"\d+")
+_DIGIT_RE = re.compile(r"\d")
+
+# Phrases that mean the assistant just asked for a due date / an email address,
+# and ones that mean it is talking about emailing the quote instead.
+_DUE_PHRASE_RE = re.compile(
+    r"due date|delivery date|ready|when would you like|when should|what date|yyyy-mm-dd|future date"
+)
+_EMAIL_ASK_RE = re.compile(r"e-?mail address|your e-?mail")
+_EMAIL_SEND_RE = re.compile(r"emailed to|email the|send the quote")
+# User questions that get a direct price answer instead of a model round trip.
+_PRICE_RE = re.compile(r"price|cost|how much")
+# Phrases in a plain model reply that swap it for a canned answer. Matching
+# is case-insensitive (ASCII folding), so the reply is never lowercased.
+# Most replies contain none, so a plain search gates the slower lookahead
+# scan that reports every occurrence, including overlapping ones.
+_REPLY_TRIGGERS = (
+    r"model|mistral|codestral|command:download_file|\[markdown\]|\[text\]|\[pdf\]"
+    r"|only assist|2023|last update|knowledge cutoff"
 )
+_REPLY_TRIGGER_ANY_RE = re.compile(_REPLY_TRIGGERS, re.IGNORECASE | re.ASCII)
+_REPLY_TRIGGER_RE = re.compile(f"(?=({_REPLY_TRIGGERS}))", re.IGNORECASE | re.ASCII)
+
+# Month numbers by three-letter prefix; every full or abbreviated month name
+# ("sept", "september") is matched through its first three letters.
+_MONTH_MAP = {
+    "jan": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "may": 5,
+    "jun": 6,
+    "jul": 7,
+    "aug": 8,
+    "sep": 9,
+    "oct": 10,
+    "nov": 11,
+    "dec": 12,
+}
+_WEEKDAYS = {
+    "monday": 0,
+    "tuesday": 1,
+    "wednesday": 2,
+    "thursday": 3,
+    "friday": 4,
+    "saturday": 5,
+    "sunday": 6,
+}
+
+
+# Environment-driven UI settings, read once per process (like the pricing
+# settings); call ui_settings.cache_clear() after changing the environment.
+@functools.lru_cache(maxsize=1)
+def ui_settings():
+    return {
+        "admin_password": os.environ.get("ADMIN_PASSWORD", "").strip(),
+        "mistral_api_key": os.environ.get("MISTRAL_API_KEY", "").strip(),
+        "mistral_base_url": os.environ.get("MISTRAL_BASE_URL", "https://api.mistral.ai/v1").rstrip("/"),
+        "mistral_model": os.environ.get("MISTRAL_MODEL", "mistral-large-latest"),
+        "world_time_enabled": os.environ.get("WORLD_TIME_API_ENABLED", "false").lower()
+        in ("1", "true", "yes"),
+        "world_time_url": os.environ.get(
+            "WORLD_TIME_API_URL", "http://worldtimeapi.org/api/timezone/Europe/London"
+        ),
+        "date_validation_country": os.environ.get("DATE_VALIDATION_COUNTRY", "GB").strip() or "GB",
+        "date_validation_url": os.environ.get(
+            "DATE_VALIDATION_API_URL",
+            "https://date.nager.at/api/v3/publicholidays/{year}/{country}",
+        ),
+        "date_validation_today": os.environ.get("DATE_VALIDATION_TODAY", "").strip(),
+    }
 
 
-app = FastAPI(title="Bakery Quotation UI")
-ADMIN_COOKIE_NAME = "bakery_admin"
+# The secret only changes if ADMIN_PASSWORD does, so compute each HMAC once.
+# The raw digest is what cookies are checked against; the hex form is what
+# gets set in the cookie.
+@functools.lru_cache(maxsize=4)
+def admin_token_digest(secret):
+    return hmac.new(secret.encode("utf-8"), b"admin", hashlib.sha256).digest()
 
 
 def admin_token(secret):
-    return hmac.new(secret.encode("utf-8"), b"admin", hashlib.sha256).hexdigest()
+    return admin_token_digest(secret).hex()
+
+
+def admin_cookie_name(request):
+    # (name, secure) for the admin session cookie on this request's scheme.
+    if request.url.scheme == "https":
+        return ADMIN_COOKIE_NAME, True
+    return ADMIN_COOKIE_NAME_HTTP, False
 
 
 def admin_cookie_valid(request):
-    secret = os.environ.get("ADMIN_PASSWORD", "").strip()
+    secret = ui_settings()["admin_password"]
     if not secret:
         return False
-    token = request.cookies.get(ADMIN_COOKIE_NAME, "")
-    return hmac.compare_digest(token, admin_token(secret))
+    raw = request.cookies.get(ADMIN_COOKIE_NAME) or request.cookies.get(ADMIN_COOKIE_NAME_HTTP, "")
+    try:
+        token = bytes.fromhex(raw)
+    except ValueError:
+        return False
+    return hmac.compare_digest(token, admin_token_digest(secret))
 
 
-def page_template(title, body, show_header=True, body_class=""):
-    return f"""<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="utf-8" />
-  <meta name="viewport" content="width=device-width, initial-scale=1" />
-  <title>{html.escape(title)}</title>
-    <style>
-    :root {{
+_PAGE_STYLE = """    <style>
+    :root {
       --bg: #edf1ff;
       --ink: #171a2b;
       --accent: #4f3df5;
@@ -64,9 +178,9 @@ def page_template(title, body, show_header=True, body_class=""):
       --panel: #ffffff;
       --border: #dfe6fb;
       --shadow: rgba(20, 28, 60, 0.15);
-    }}
-    * {{ box-sizing: border-box; }}
-    body {{
+    }
+    * { box-sizing: border-box; }
+    body {
       margin: 0;
       font-family: "Avenir Next", "Avenir", "Gill Sans", "Trebuchet MS", sans-serif;
       color: var(--ink);
@@ -74,11 +188,11 @@ def page_template(title, body, show_header=True, body_class=""):
       min-height: 100vh;
       position: relative;
       overflow-x: hidden;
-    }}
-    html, body {{
+    }
+    html, body {
       height: 100%;
-    }}
-    body::before {{
+    }
+    body::before {
       content: "";
       position: fixed;
       inset: -30vmax;
@@ -89,42 +203,42 @@ def page_template(title, body, show_header=True, body_class=""):
       filter: blur(10px);
       animation: drift 20s ease-in-out infinite;
       z-index: -2;
-    }}
-    .landing {{
+    }
+    .landing {
       position: relative;
       min-height: 100vh;
       overflow: hidden;
       display: flex;
       flex-direction: column;
-    }}
-    #vanta-bg {{
+    }
+    #vanta-bg {
       position: fixed;
       inset: 0;
       z-index: 0;
-    }}
-    .landing-shell {{
+    }
+    .landing-shell {
       position: relative;
       z-index: 1;
       max-width: 1200px;
       margin: 0 auto;
       padding: 26px 28px 0;
       width: 100%;
-    }}
-    .landing-nav {{
+    }
+    .landing-nav {
       display: flex;
       align-items: center;
       justify-content: space-between;
       gap: 16px;
       padding: 8px 10px 22px;
-    }}
-    .brand {{
+    }
+    .brand {
       display: flex;
       align-items: center;
       gap: 10px;
       font-weight: 700;
       letter-spacing: 0.3px;
-    }}
-    .brand-mark {{
+    }
+    .brand-mark {
       width: 36px;
       height: 36px;
       border-radius: 12px;
@@ -132,78 +246,78 @@ def page_template(title, body, show_header=True, body_class=""):
       box-shadow: 0 10px 24px rgba(79, 61, 245, 0.35);
       display: grid;
       place-items: center;
-    }}
-    .brand-mark svg {{
+    }
+    .brand-mark svg {
       width: 26px;
       height: 26px;
-    }}
-    .nav-links {{
+    }
+    .nav-links {
       display: flex;
       gap: 18px;
       font-size: 14px;
       opacity: 0.75;
-    }}
-    .nav-links a {{
+    }
+    .nav-links a {
       text-decoration: none;
       color: var(--ink);
-    }}
-    .nav-links span {{
+    }
+    .nav-links span {
       color: var(--ink);
-    }}
-    .nav-actions {{
+    }
+    .nav-actions {
       display: flex;
       gap: 12px;
       align-items: center;
-    }}
-    .nav-actions a {{
+    }
+    .nav-actions a {
       text-decoration: none;
       font-size: 14px;
       color: var(--ink);
-    }}
-    .nav-actions .nav-cta {{
+    }
+    .nav-actions .nav-cta {
       color: #fff;
-    }}
-    .nav-cta {{
+    }
+    .nav-cta {
       padding: 10px 16px;
       border-radius: 999px;
       background: var(--accent);
       color: #fff;
       font-weight: 700;
       box-shadow: 0 10px 22px rgba(79, 61, 245, 0.3);
-    }}
-    .hero {{
+    }
+    .hero {
       display: grid;
       grid-template-columns: repeat(2, minmax(0, 1fr));
       gap: 36px;
       align-items: center;
       padding: 20px 10px 40px;
       min-height: calc(100vh - 160px);
-    }}
-    .hero-copy h1 {{
+    }
+    .hero-copy h1 {
       font-family: "Iowan Old Style", "Baskerville", "Didot", serif;
       font-size: clamp(38px, 5.6vw, 64px);
       line-height: 1.05;
       margin: 0 0 16px;
-    }}
-    .hero-copy p {{
+    }
+    .hero-copy p {
       font-size: 17px;
       opacity: 0.78;
       margin: 0 0 22px;
       max-width: 520px;
-    }}
-    .eyebrow {{
+    }
+    .eyebrow {
       font-size: 13px;
       text-transform: uppercase;
       letter-spacing: 2px;
       color: rgba(23, 26, 43, 0.65);
       margin-bottom: 14px;
-    }}
-    .hero-actions {{
+    }
+    .hero-actions {
       display: flex;
       gap: 12px;
       flex-wrap: wrap;
-    }}
-    .hero-actions a {{
+    }
+    .hero-actions a {
       text-decoration: none;
       font-weight: 700;
       letter-spacing: 0.4px;
@@ -214,34 +328,34 @@ def page_template(title, body, show_header=True, body_class=""):
       border: 1px solid rgba(23, 26, 43, 0.12);
       box-shadow: 0 14px 32px rgba(15, 24, 64, 0.18);
       transition: transform 0.2s ease, box-shadow 0.2s ease;
-    }}
-    .hero-actions a.primary {{
+    }
+    .hero-actions a.primary {
       background: var(--accent);
       color: #fff;
       border-color: transparent;
-    }}
-    .hero-actions a:hover {{
+    }
+    .hero-actions a:hover {
       transform: translateY(-2px);
-    }}
-    .hero-visual {{
+    }
+    .hero-visual {
       display: grid;
       gap: 14px;
       justify-items: end;
-    }}
-    .visual-bubble {{
+    }
+    .visual-bubble {
       background: #ffffff;
       border-radius: 18px;
       padding: 12px 16px;
       box-shadow: 0 12px 26px rgba(18, 24, 56, 0.12);
       max-width: 320px;
       font-size: 14px;
-    }}
-    .visual-bubble.user {{
+    }
+    .visual-bubble.user {
       background: linear-gradient(135deg, rgba(90, 75, 255, 0.9), rgba(71, 158, 255, 0.9));
       color: #fff;
       margin-left: auto;
-    }}
-    .visual-product {{
+    }
+    .visual-product {
       background: #ffffff;
       border-radius: 22px;
       padding: 16px;
@@ -250,8 +364,8 @@ def page_template(title, body, show_header=True, body_class=""):
       gap: 14px;
       box-shadow: 0 16px 32px rgba(18, 24, 56, 0.14);
       max-width: 360px;
-    }}
-    .product-image {{
+    }
+    .product-image {
       width: 80px;
       height: 80px;
       border-radius: 18px;
@@ -262,29 +376,29 @@ def page_template(title, body, show_header=True, body_class=""):
       color: rgba(79, 61, 245, 0.6);
       font-weight: 700;
       font-size: 18px;
-    }}
-    .product-image svg {{
+    }
+    .product-image svg {
       width: 54px;
       height: 54px;
-    }}
-    .product-title {{
+    }
+    .product-title {
       font-weight: 700;
       margin-bottom: 6px;
-    }}
-    .product-meta {{
+    }
+    .product-meta {
       font-size: 12px;
       opacity: 0.7;
       margin-bottom: 10px;
-    }}
-    .mini-btn {{
+    }
+    .mini-btn {
       padding: 6px 12px;
       border-radius: 999px;
       background: #131526;
       color: #fff;
       font-size: 11px;
       border: none;
-    }}
-    .visual-total {{
+    }
+    .visual-total {
       background: #ffffff;
       border-radius: 999px;
       padding: 10px 16px;
@@ -293,12 +407,12 @@ def page_template(title, body, show_header=True, body_class=""):
       gap: 12px;
       box-shadow: 0 12px 26px rgba(18, 24, 56, 0.12);
       font-size: 13px;
-    }}
-    .visual-total span {{
+    }
+    .visual-total span {
       font-weight: 700;
       color: #18a65f;
-    }}
-    .dot-wave {{
+    }
+    .dot-wave {
       position: absolute;
       left: 0;
       right: 0;
@@ -308,8 +422,8 @@ def page_template(title, body, show_header=True, body_class=""):
       background-size: 18px 18px;
       opacity: 0.6;
       mask-image: linear-gradient(180deg, transparent 0%, rgba(0, 0, 0, 0.5) 40%, #000 100%);
-    }}
-    .admin-panel {{
+    }
+    .admin-panel {
       margin: 0;
       background: rgba(255, 255, 255, 0.92);
       border-radius: 22px;
@@ -318,55 +432,55 @@ def page_template(title, body, show_header=True, body_class=""):
       border: 1px solid rgba(223, 230, 251, 0.9);
       backdrop-filter: blur(10px);
       width: min(90vw, 760px);
-    }}
-    .admin-panel h2 {{
+    }
+    .admin-panel h2 {
       margin: 0 0 8px;
       font-size: 18px;
-    }}
-    .admin-panel p {{
+    }
+    .admin-panel p {
       margin: 0 0 12px;
       opacity: 0.7;
       font-size: 13px;
-    }}
-    .admin-row {{
+    }
+    .admin-row {
       display: flex;
       gap: 10px;
       flex-wrap: wrap;
       align-items: center;
-    }}
-    .admin-row input {{
+    }
+    .admin-row input {
       flex: 1 1 220px;
-    }}
-    .admin-table {{
+    }
+    .admin-table {
       width: 100%;
       border-collapse: collapse;
       font-size: 13px;
       margin-top: 12px;
-    }}
+    }
     .admin-table th,
-    .admin-table td {{
+    .admin-table td {
       text-align: left;
       padding: 10px 8px;
       border-bottom: 1px solid rgba(223, 230, 251, 0.8);
-    }}
-    .admin-table th {{
+    }
+    .admin-table th {
       font-weight: 700;
       font-size: 12px;
       text-transform: uppercase;
       letter-spacing: 0.8px;
       opacity: 0.6;
-    }}
-    .admin-table input {{
+    }
+    .admin-table input {
       width: 110px;
       padding: 6px 8px;
       border-radius: 10px;
-    }}
-    .admin-status {{
+    }
+    .admin-status {
       font-size: 12px;
       margin-top: 8px;
       color: rgba(23, 26, 43, 0.7);
-    }}
-    .admin-overlay {{
+    }
+    .admin-overlay {
       position: fixed;
       inset: 0;
       display: none;
@@ -375,47 +489,47 @@ def page_template(title, body, show_header=True, body_class=""):
       background: rgba(19, 23, 44, 0.35);
       z-index: 5;
       padding: 24px;
-    }}
-    .admin-overlay.active {{
+    }
+    .admin-overlay.active {
       display: flex;
-    }}
-    .admin-footer {{
+    }
+    .admin-footer {
       display: flex;
       justify-content: space-between;
       align-items: center;
       gap: 10px;
       margin-top: 10px;
       flex-wrap: wrap;
-    }}
-    header {{
+    }
+    header {
       padding: 28px 20px 8px;
       text-align: center;
       animation: fadeIn 0.6s ease-out;
-    }}
-    header h1 {{
+    }
+    header h1 {
       margin: 0 0 6px;
       font-family: "Iowan Old Style", "Baskerville", "Didot", serif;
       font-size: clamp(28px, 3.6vw, 42px);
       letter-spacing: 0.4px;
-    }}
-    header p {{
+    }
+    header p {
       margin: 0;
       opacity: 0.75;
       font-size: 15px;
-    }}
-    .wrap {{
+    }
+    .wrap {
       max-width: 1100px;
       margin: 0 auto;
       padding: 18px 24px 34px;
       min-height: calc(100vh - 120px);
-    }}
-    .nav {{
+    }
+    .nav {
       display: flex;
       justify-content: center;
       gap: 14px;
       margin-bottom: 14px;
-    }}
-    .nav a {{
+    }
+    .nav a {
       text-decoration: none;
       color: var(--ink);
       font-weight: 600;
@@ -423,8 +537,8 @@ def page_template(title, body, show_header=True, body_class=""):
       border-radius: 999px;
       background: #eff3ff;
       border: 1px solid var(--border);
-    }}
-    .card {{
+    }
+    .card {
       background: var(--panel);
       border-radius: 22px;
       padding: 24px;
@@ -434,38 +548,38 @@ def page_template(title, body, show_header=True, body_class=""):
       height: calc(100vh - 170px);
       display: flex;
       flex-direction: column;
-    }}
-    .grid {{
+    }
+    .grid {
       display: grid;
       grid-template-columns: repeat(2, minmax(0, 1fr));
       gap: 16px;
-    }}
-    label {{
+    }
+    label {
       display: block;
       font-size: 14px;
       margin-bottom: 6px;
       opacity: 0.8;
-    }}
-    input, select, textarea {{
+    }
+    input, select, textarea {
       width: 100%;
       padding: 10px 12px;
       border-radius: 12px;
       border: 1px solid var(--border);
       background: #fff;
       font-family: inherit;
-    }}
-    textarea {{
+    }
+    textarea {
       min-height: 70px;
       resize: vertical;
-    }}
-    .actions {{
+    }
+    .actions {
       display: flex;
       gap: 12px;
       align-items: center;
       margin-top: 8px;
       flex-wrap: wrap;
-    }}
-    button {{
+    }
+    button {
       background: var(--accent);
       color: white;
       border: none;
@@ -475,9 +589,9 @@ def page_template(title, body, show_header=True, body_class=""):
       cursor: pointer;
       transition: transform 0.2s ease, box-shadow 0.2s ease;
       box-shadow: 0 10px 24px rgba(79, 61, 245, 0.35);
-    }}
-    button:hover {{ transform: translateY(-1px); }}
-    .pill {{
+    }
+    button:hover { transform: translateY(-1px); }
+    .pill {
       background: var(--accent-2);
       color: #0a1b2e;
       padding: 4px 10px;
@@ -486,34 +600,34 @@ def page_template(title, body, show_header=True, body_class=""):
       display: inline-block;
       margin-top: 8px;
       font-weight: 600;
-    }}
-    .summary {{
+    }
+    .summary {
       margin-top: 18px;
       display: grid;
       grid-template-columns: repeat(3, minmax(0, 1fr));
       gap: 12px;
-    }}
-    .stat {{
+    }
+    .stat {
       background: #f9fbff;
       border-radius: 12px;
       padding: 12px;
       box-shadow: inset 0 0 0 1px var(--border);
-    }}
-    pre {{
+    }
+    pre {
       background: #121527;
       color: #f0f4ff;
       padding: 14px;
       border-radius: 12px;
       overflow-x: auto;
       font-size: 13px;
-    }}
-    .chat {{
+    }
+    .chat {
       display: flex;
       flex-direction: column;
       gap: 14px;
       height: 100%;
-    }}
-    .messages {{
+    }
+    .messages {
       background: #f9fbff;
       border-radius: 18px;
       padding: 16px;
@@ -523,8 +637,8 @@ def page_template(title, body, show_header=True, body_class=""):
       flex-direction: column;
       overflow-y: auto;
       box-shadow: inset 0 0 0 1px var(--border);
-    }}
-    .bubble {{
+    }
+    .bubble {
       padding: 12px 14px;
       border-radius: 14px;
       margin: 8px 0;
@@ -532,8 +646,8 @@ def page_template(title, body, show_header=True, body_class=""):
       white-space: pre-wrap;
       width: fit-content;
       box-shadow: 0 8px 20px rgba(15, 24, 64, 0.08);
-    }}
-    .quote-bubble {{
+    }
+    .quote-bubble {
       max-width: 100%;
       width: 100%;
       margin: 10px 0;
@@ -542,53 +656,53 @@ def page_template(title, body, show_header=True, body_class=""):
       border-radius: 0;
       box-shadow: none;
       border: none;
-    }}
-    .bubble.user {{
+    }
+    .bubble.user {
       background: linear-gradient(135deg, rgba(90, 75, 255, 0.92), rgba(71, 158, 255, 0.92));
       color: #fff;
       max-width: 56%;
       margin-left: auto;
       text-align: left;
       align-self: flex-end;
-    }}
-    .bubble.assistant {{
+    }
+    .bubble.assistant {
       margin-right: auto;
       background: #ffffff;
       border: 1px solid var(--border);
-    }}
-    .bubble.assistant.quote-bubble {{
+    }
+    .bubble.assistant.quote-bubble {
       background: transparent;
       padding: 0;
-    }}
-    .chat-input {{
+    }
+    .chat-input {
       display: flex;
       gap: 10px;
-    }}
-    .chat-input textarea {{
+    }
+    .chat-input textarea {
       min-height: 64px;
-    }}
-    .quote-card {{
+    }
+    .quote-card {
       background: linear-gradient(135deg, #ffffff 0%, #f0f4ff 100%);
       border-radius: 16px;
       padding: 14px;
       box-shadow: inset 0 0 0 1px rgba(79, 61, 245, 0.15);
       width: 100%;
-    }}
-    .quote-title {{
+    }
+    .quote-title {
       font-weight: 700;
       margin-bottom: 6px;
-    }}
-    .quote-meta {{
+    }
+    .quote-meta {
       font-size: 14px;
       opacity: 0.85;
-    }}
-    .quote-actions {{
+    }
+    .quote-actions {
       display: flex;
       gap: 10px;
       margin-top: 10px;
       flex-wrap: wrap;
-    }}
-    .btn-link {{
+    }
+    .btn-link {
       display: inline-flex;
       align-items: center;
       gap: 6px;
@@ -599,49 +713,70 @@ def page_template(title, body, show_header=True, body_class=""):
       text-decoration: none;
       font-size: 13px;
       border: 1px solid var(--border);
-    }}
-    .landing-page header {{
+    }
+    .landing-page header {
       display: none;
-    }}
-    .landing-page .wrap {{
+    }
+    .landing-page .wrap {
       max-width: none;
       padding: 0;
       min-height: 100vh;
-    }}
-    .landing-page .card {{
+    }
+    .landing-page .card {
       background: transparent;
       border: none;
       box-shadow: none;
       padding: 0;
       height: auto;
       min-height: 100vh;
-    }}
-    @keyframes fadeIn {{
-      from {{ opacity: 0; transform: translateY(8px); }}
-      to {{ opacity: 1; transform: translateY(0); }}
-    }}
-    @keyframes rise {{
-      from {{ opacity: 0; transform: translateY(16px); }}
-      to {{ opacity: 1; transform: translateY(0); }}
-    }}
-    @keyframes drift {{
-      0% {{ transform: translate3d(-2%, -1%, 0) scale(1); }}
-      50% {{ transform: translate3d(2%, 1%, 0) scale(1.03); }}
-      100% {{ transform: translate3d(-2%, -1%, 0) scale(1); }}
-    }}
-    @media (max-width: 900px) {{
-      .hero {{ grid-template-columns: 1fr; }}
-      .hero-visual {{ justify-items: start; }}
-      .nav-links {{ display: none; }}
-    }}
-    @media (max-width: 720px) {{
-      .grid {{ grid-template-columns: 1fr; }}
-      .summary {{ grid-template-columns: 1fr; }}
-    }}
-  </style>
+    }
+    @keyframes fadeIn {
+      from { opacity: 0; transform: translateY(8px); }
+      to { opacity: 1; transform: translateY(0); }
+    }
+    @keyframes rise {
+      from { opacity: 0; transform: translateY(16px); }
+      to { opacity: 1; transform: translateY(0); }
+    }
+    @keyframes drift {
+      0% { transform: translate3d(-2%, -1%, 0) scale(1); }
+      50% { transform: translate3d(2%, 1%, 0) scale(1.03); }
+      100% { transform: translate3d(-2%, -1%, 0) scale(1); }
+    }
+    @media (max-width: 900px) {
+      .hero { grid-template-columns: 1fr; }
+      .hero-visual { justify-items: start; }
+      .nav-links { display: none; }
+    }
+    @media (max-width: 720px) {
+      .grid { grid-template-columns: 1fr; }
+      .summary { grid-template-columns: 1fr; }
+    }
+  </style>"""
+_PAGE_HEADER = (
+    "<header><h1>Bakery Quotation Studio</h1>"
+    "<p>Turn a quick conversation into a polished quote, fast.</p></header>"
+)
+
+
+# Memoized html.escape for the short values that recur across pages (titles,
+# currency codes, quote ids/filenames, warnings). Not for whole documents.
+_esc = functools.lru_cache(maxsize=4096)(html.escape)
+
+
+def page_template(title, body, show_header=True, body_class=""):
+    # The stylesheet and header are constants; only four slots vary per page.
+    header = _PAGE_HEADER if show_header else ""
+    return f"""<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1" />
+  <title>{_esc(title)}</title>
+{_PAGE_STYLE}
 </head>
 <body class="{body_class}">
-  {"<header><h1>Bakery Quotation Studio</h1><p>Turn a quick conversation into a polished quote, fast.</p></header>" if show_header else ""}
+  {header}
   <div class="wrap">
     <div class="card">
       {body}
@@ -651,12 +786,22 @@ def page_template(title, body, show_header=True, body_class=""):
 </html>"""
 
 
-def mistral_chat(messages, tools=None, tool_choice=None):
-    api_key = os.environ.get("MISTRAL_API_KEY", "").strip()
+# Date lookups share the pricing keep-alive pool with the Mistral calls.
+_API_HEADERS = {"User-Agent": "bakery-quote-agent"}
+
+
+def json_text(obj):
+    # Tool message content and sheet cells need str; encode via orjson.
+    return dumps(obj).decode("utf-8")
+
+
+def _mistral_request(messages, tools=None, tool_choice=None, stream=False):
+    settings = ui_settings()
+    api_key = settings["mistral_api_key"]
     if not api_key:
         raise ValueError("MISTRAL_API_KEY is not configured")
-    base_url = os.environ.get("MISTRAL_BASE_URL", "https://api.mistral.ai/v1").rstrip("/")
-    model = os.environ.get("MISTRAL_MODEL", "mistral-large-latest")
+    base_url = settings["mistral_base_url"]
+    model = settings["mistral_model"]
     payload = {
         "model": model,
         "messages": messages,
@@ -666,59 +811,127 @@ def mistral_chat(messages, tools=None, tool_choice=None):
         payload["tools"] = tools
     if tool_choice:
         payload["tool_choice"] = tool_choice
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"{base_url}/chat/completions",
-        data=data,
-        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-    )
+    if stream:
+        payload["stream"] = True
+    # Pooled so each turn reuses the open TLS connection to Mistral.
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8")
-        raise RuntimeError(f"Mistral API error {exc.code}: {detail}")
-    except urllib.error.URLError as exc:
+        resp = http_pool().request(
+            "POST",
+            f"{base_url}/chat/completions",
+            body=dumps(payload),
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            timeout=30,
+            preload_content=not stream,
+        )
+    except urllib3.exceptions.HTTPError as exc:
         raise RuntimeError(f"Mistral API unreachable: {exc}")
+    if resp.status >= 400:
+        detail = resp.data.decode("utf-8")
+        resp.release_conn()
+        raise RuntimeError(f"Mistral API error {resp.status}: {detail}")
+    return resp
+
+
+def mistral_chat(messages, tools=None, tool_choice=None):
+    return loads(_mistral_request(messages, tools, tool_choice).data)
+
+
+def mistral_chat_stream(messages):
+    # Yields reply text as Mistral streams it (SSE "data:" lines).
+    resp = _mistral_request(messages, stream=True)
+    try:
+        for line in resp:
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            choices = loads(data).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        resp.drain_conn()
+        resp.release_conn()
+
+
+def sse_event(obj):
+    return b"data: " + dumps(obj) + b"\n\n"
+
+
+def follow_up_events(messages, quote_payload):
+    # Sync generator, so Starlette iterates it in a worker thread.
+    sent = False
+    try:
+        for delta in mistral_chat_stream(messages):
+            sent = True
+            yield sse_event({"delta": delta})
+    except Exception as exc:
+        print(f"[chat] streamed reply failed: {exc}")
+    if not sent:
+        yield sse_event({"delta": "Done. Let me know if you need anything else."})
+    done = {"done": True}
+    if quote_payload:
+        done["quote"] = quote_payload
+    yield sse_event(done)
+
+
+@functools.lru_cache(maxsize=1)
+def london_zone():
+    try:
+        return ZoneInfo("Europe/London")
+    except ZoneInfoNotFoundError:
+        print("[date] tz database unavailable; falling back to WorldTimeAPI")
+        return None
 
 
 def fetch_london_date():
-    url = os.environ.get("WORLD_TIME_API_URL", "http://worldtimeapi.org/api/timezone/Europe/London")
-    req = urllib.request.Request(url, headers={"User-Agent": "bakery-quote-agent"})
-    with urllib.request.urlopen(req, timeout=10) as resp:
-        payload = json.loads(resp.read().decode("utf-8"))
-    dt_str = payload.get("datetime")
-    if not dt_str:
-        raise RuntimeError("WorldTimeAPI response missing datetime")
-    return dt.date.fromisoformat(dt_str[:10])
+    # Computed locally from the tz database; WorldTimeAPI is only consulted
+    # when WORLD_TIME_API_ENABLED is set or no tz data is installed.
+    zone = None if ui_settings()["world_time_enabled"] else london_zone()
+    if zone is not None:
+        return dt.datetime.now(zone).date()
+    return fetch_world_time_date()
+
+
+# The London date changes once a day, so one lookup serves every chat turn
+# for a few minutes. If the API is down, the server's date is used (and
+# cached the same way) rather than stalling each turn on a 10s timeout.
+@ttl_cache(ttl=300)
+def fetch_world_time_date():
+    url = ui_settings()["world_time_url"]
+    try:
+        resp = http_pool().request("GET", url, headers=_API_HEADERS, timeout=10)
+        if resp.status >= 400:
+            raise RuntimeError(f"HTTP {resp.status}")
+        payload = loads(resp.data)
+        dt_str = payload.get("datetime")
+        if not dt_str:
+            raise RuntimeError("WorldTimeAPI response missing datetime")
+        return dt.date.fromisoformat(dt_str[:10])
+    except Exception as exc:
+        print(f"[date] WorldTimeAPI unavailable ({exc}); using local date")
+        return dt.date.today()
 
 
-def resolve_due_date(text):
+def resolve_due_date(text, today=None):
     if not text:
         return text
     lowered = text.strip().lower()
-    if re.match(r"^\d{4}-\d{2}-\d{2}$", lowered):
+    if _ISO_RE.match(lowered):
         return lowered
-    try:
-        today = fetch_london_date()
-    except Exception:
-        return text
+    if today is None:
+        try:
+            today = fetch_london_date()
+        except Exception:
+            return text
     if "today" in lowered:
         return today.isoformat()
     if "tomorrow" in lowered:
         return (today + dt.timedelta(days=1)).isoformat()
-    weekdays = {
-        "monday": 0,
-        "tuesday": 1,
-        "wednesday": 2,
-        "thursday": 3,
-        "friday": 4,
-        "saturday": 5,
-        "sunday": 6,
-    }
-    match = re.search(r"(next\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday)", lowered)
+    match = _WEEKDAY_RE.search(lowered)
     if match:
-        target = weekdays[match.group(2)]
+        target = _WEEKDAYS[match.group(2)]
         days_ahead = (target - today.weekday()) % 7
         if days_ahead == 0 or match.group(1):
             days_ahead = 7 if days_ahead == 0 else days_ahead
@@ -731,38 +944,18 @@ def normalize_due_date_text(text, today):
         return None
     cleaned = text.strip()
     lowered = cleaned.lower()
-    resolved = resolve_due_date(cleaned)
+    # Relative phrases resolve against the same "today" the caller validates
+    # with, so the date is only looked up once per turn.
+    resolved = resolve_due_date(cleaned, today)
     if resolved != cleaned:
         return resolved
 
-    month_map = {
-        "jan": 1,
-        "january": 1,
-        "feb": 2,
-        "february": 2,
-        "mar": 3,
-        "march": 3,
-        "apr": 4,
-        "april": 4,
-        "may": 5,
-        "jun": 6,
-        "june": 6,
-        "jul": 7,
-        "july": 7,
-        "aug": 8,
-        "august": 8,
-        "sep": 9,
-        "sept": 9,
-        "september": 9,
-        "oct": 10,
-        "october": 10,
-        "nov": 11,
-        "november": 11,
-        "dec": 12,
-        "december": 12,
-    }
-
-    iso_match = re.search(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", cleaned)
+    # Every pattern below needs a digit, and the first two a "-" or "/", so
+    # cheap checks skip scans that cannot match while keeping their order.
+    if _DIGIT_RE.search(cleaned) is None:
+        return None
+
+    iso_match = _ISO_SEARCH_RE.search(cleaned) if "-" in cleaned else None
     if iso_match:
         year, month, day = map(int, iso_match.groups())
         try:
@@ -770,7 +963,7 @@ def normalize_due_date_text(text, today):
         except ValueError:
             return None
 
-    slash_match = re.search(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b", cleaned)
+    slash_match = _SLASH_RE.search(cleaned) if "/" in cleaned else None
     if slash_match:
         day, month, year = slash_match.groups()
         day = int(day)
@@ -786,13 +979,10 @@ def normalize_due_date_text(text, today):
         except ValueError:
             return None
 
-    word_day_first = re.search(
-        r"\b(\d{1,2})(?:st|nd|rd|th)?\s+([a-zA-Z]+)(?:\s+(\d{2,4}))?\b",
-        lowered,
-    )
+    word_day_first = _WORD_DAY_RE.search(lowered)
     if word_day_first:
         day_raw, month_raw, year_raw = word_day_first.groups()
-        month = month_map.get(month_raw[:3], month_map.get(month_raw))
+        month = _MONTH_MAP.get(month_raw[:3])
         if month:
             day = int(day_raw)
             if year_raw is None:
@@ -806,13 +996,10 @@ def normalize_due_date_text(text, today):
             except ValueError:
                 return None
 
-    word_month_first = re.search(
-        r"\b([a-zA-Z]+)\s+(\d{1,2})(?:st|nd|rd|th)?(?:\s+(\d{2,4}))?\b",
-        lowered,
-    )
+    word_month_first = _WORD_MONTH_RE.search(lowered)
     if word_month_first:
         month_raw, day_raw, year_raw = word_month_first.groups()
-        month = month_map.get(month_raw[:3], month_map.get(month_raw))
+        month = _MONTH_MAP.get(month_raw[:3])
         if month:
             day = int(day_raw)
             if year_raw is None:
@@ -830,17 +1017,14 @@ def normalize_due_date_text(text, today):
 
 
 def validate_due_date_via_api(date_obj):
-    country = os.environ.get("DATE_VALIDATION_COUNTRY", "GB").strip() or "GB"
-    url_template = os.environ.get(
-        "DATE_VALIDATION_API_URL",
-        "https://date.nager.at/api/v3/publicholidays/{year}/{country}",
-    )
-    url = url_template.format(year=date_obj.year, country=country)
-    req = urllib.request.Request(url, headers={"User-Agent": "bakery-quote-agent"})
+    settings = ui_settings()
+    country = settings["date_validation_country"]
+    url = settings["date_validation_url"].format(year=date_obj.year, country=country)
     try:
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            payload = json.loads(resp.read().decode("utf-8"))
-        return isinstance(payload, list)
+        resp = http_pool().request("GET", url, headers=_API_HEADERS, timeout=5)
+        if resp.status >= 400:
+            return False
+        return isinstance(loads(resp.data), list)
     except Exception:
         return False
 
@@ -852,13 +1036,13 @@ def validate_email_via_api(email):
 def validate_email_locally(email):
     if not email:
         return False
-    ok = re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", email) is not None
+    ok = _EMAIL_RE.match(email) is not None
     print(f"[email] local validation email={email} ok={ok}")
     return ok
 
 
 def validation_today():
-    override = os.environ.get("DATE_VALIDATION_TODAY", "").strip()
+    override = ui_settings()["date_validation_today"]
     if override:
         try:
             return dt.date.fromisoformat(override)
@@ -871,7 +1055,14 @@ def validation_today():
 
 
 def chat_system_prompt(job_types, fx_rates):
-    fx_list = ", ".join(sorted(fx_rates.keys())) if fx_rates else "None"
+    return _chat_system_prompt(tuple(job_types), frozenset(fx_rates) if fx_rates else frozenset())
+
+
+# Job types and FX currencies rarely change, so the prompt is built once per
+# combination rather than on every turn.
+@functools.lru_cache(maxsize=8)
+def _chat_system_prompt(job_types, fx_codes):
+    fx_list = ", ".join(sorted(fx_codes)) if fx_codes else "None"
     return (
         "You are a friendly bakery assistant chatting with a customer. Ask for missing "
         "details step-by-step in natural language (one question at a time). "
@@ -895,60 +1086,66 @@ def chat_system_prompt(job_types, fx_rates):
     )
 
 
-def last_user_message(messages):
+def last_messages(messages):
+    # One backwards pass for both roles, stopping once each has been seen.
+    found = {}
     for msg in reversed(messages):
-        if msg.get("role") == "user":
-            return msg.get("content", "")
-    return ""
+        role = msg.get("role")
+        if (role == "user" or role == "assistant") and role not in found:
+            found[role] = msg.get("content", "")
+            if len(found) == 2:
+                break
+    return found.get("user", ""), found.get("assistant", "")
+
+
+def last_user_message(messages):
+    return last_messages(messages)[0]
 
 
 def last_assistant_message(messages):
-    for msg in reversed(messages):
-        if msg.get("role") == "assistant":
-            return msg.get("content", "")
-    return ""
+    return last_messages(messages)[1]
 
 
 def assistant_requested_due_date(text):
     if not text:
         return False
-    lowered = text.lower()
-    return any(
-        phrase in lowered
-        for phrase in (
-            "due date",
-            "delivery date",
-            "ready",
-            "when would you like",
-            "when should",
-            "what date",
-            "yyyy-mm-dd",
-            "future date",
-        )
-    )
+    return _DUE_PHRASE_RE.search(text.lower()) is not None
 
 
 def assistant_requested_email(text):
     if not text:
         return False
     lowered = text.lower()
-    if "email address" in lowered or "e-mail address" in lowered:
+    if _EMAIL_ASK_RE.search(lowered):
         return True
-    if "your email" in lowered or "your e-mail" in lowered:
-        return True
-    if "emailed to" in lowered or "email the" in lowered or "send the quote" in lowered:
+    if _EMAIL_SEND_RE.search(lowered):
         return False
     return "email" in lowered and "address" in lowered
 
 
+# One pattern per name list: alternative i is a lookahead for names[i], so a
+# match at position 0 picks the first listed name that occurs anywhere in the
+# text (list order wins, as with the plain loop), in a single C-level call.
+@functools.lru_cache(maxsize=16)
+def _first_name_matcher(names):
+    pattern = "|".join(f"(?=.*?({re.escape(name)}))" for name in names)
+    return re.compile(pattern, re.S)
+
+
+def _first_name_in(lowered, names):
+    if not names:
+        return None
+    match = _first_name_matcher(names).match(lowered)
+    if match is None:
+        return None
+    return names[match.lastindex - 1]
+
+
 def extract_job_type(text, job_types):
     lowered = text.lower()
     if "cupcake" in lowered:
         return "cupcakes"
-    for jt in job_types:
-        if jt in lowered:
-            return jt
-    return None
+    return _first_name_in(lowered, tuple(job_types))
 
 
 def extract_job_type_from_messages(messages, job_types):
@@ -962,34 +1159,77 @@ def extract_job_type_from_messages(messages, job_types):
 
 
 def extract_quantity(text):
-    match = re.search(r"(\d+)", text)
-    if match:
-        try:
-            return int(match.group(1))
-        except ValueError:
-            return None
-    return None
+    # A compiled search beats a per-character Python scan here; the digit run
+    # is converted directly (ValueError only for absurdly long numbers).
+    match = _QTY_RE.search(text)
+    if match is None:
+        return None
+    try:
+        return int(match.group())
+    except ValueError:
+        return None
 
 
 def find_material_in_text(text, materials):
-    lowered = text.lower()
-    for mat in materials:
-        if mat["name"] in lowered:
-            return mat["name"]
-    return None
+    return _first_name_in(text.lower(), tuple(mat["name"] for mat in materials))
+
+
+# Job types change rarely, so each list is escaped once and reused.
+@functools.lru_cache(maxsize=8)
+def _escaped_job_types(job_types):
+    return tuple((jt, html.escape(jt)) for jt in job_types)
 
 
 def job_type_options(job_types: List[str], selected: str):
     options = []
-    for jt in job_types:
+    for jt, esc in _escaped_job_types(tuple(job_types)):
         sel = " selected" if jt == selected else ""
-        options.append(f"<option value=\"{html.escape(jt)}\"{sel}>{html.escape(jt)}</option>")
+        options.append(f"<option value=\"{esc}\"{sel}>{esc}</option>")
     return "\n".join(options)
 
 
-@app.get("/", response_class=HTMLResponse)
-def index():
-    body = """
+_ADMIN_PAYLOAD = None
+
+
+def admin_materials_payload(materials):
+    # The /admin/materials JSON body (with pre-escaped *_html fields for the
+    # table) and its ETag. list_materials hands back the same list until the
+    # cache expires or a cost is updated, so this is rebuilt only when that
+    # list object changes.
+    global _ADMIN_PAYLOAD
+    if _ADMIN_PAYLOAD is None or _ADMIN_PAYLOAD[0] is not materials:
+        rows = [
+            dict(
+                mat,
+                name_html=html.escape(mat["name"]),
+                unit_html=html.escape(str(mat["unit"])),
+                currency_html=html.escape(str(mat["currency"])),
+            )
+            for mat in materials
+        ]
+        body = dumps({"ok": True, "materials": rows})
+        _ADMIN_PAYLOAD = (materials, body, f'"{hashlib.md5(body).hexdigest()}"')
+    return _ADMIN_PAYLOAD[1], _ADMIN_PAYLOAD[2]
+
+
+def precompressed(body):
+    # Identity and gzip renditions of a fixed body, each with its own ETag.
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    return {False: (body, etag), True: (gzip.compress(body, 9), etag[:-1] + '-gz"')}
+
+
+def precompressed_response(request, variants, media_type, cache_control):
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    body, etag = variants[gzipped]
+    headers = {"Cache-Control": cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+_LANDING_BODY = """
     <div class="landing">
       <div id="vanta-bg"></div>
       <div class="landing-shell" id="landingContent">
@@ -1143,36 +1383,61 @@ def index():
           setStatus(data.error || "Unable to load materials.");
           return;
         }
-        adminTableBody.innerHTML = "";
-        data.materials.forEach((mat) => {
-          const row = document.createElement("tr");
-          row.innerHTML = `
-            <td>${mat.name}</td>
-            <td>${mat.unit}</td>
-            <td>${mat.currency}</td>
-            <td><input type="number" step="0.01" value="${mat.unit_cost}" data-name="${mat.name}" /></td>
-            <td><button class="mini-btn" data-name="${mat.name}">Save</button></td>
-          `;
-          adminTableBody.appendChild(row);
-        });
-        adminTableBody.querySelectorAll("button").forEach((btn) => {
-          btn.addEventListener("click", async (e) => {
-            const name = e.currentTarget.getAttribute("data-name");
-            const input = adminTableBody.querySelector(`input[data-name="${name}"]`);
-            const unit_cost = input.value;
-            const resp = await fetch("/admin/materials/update", {
-              method: "POST",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({ name, unit_cost })
-            });
-            const result = await resp.json();
-            if (result.ok) {
-              setStatus(`Saved ${name}.`);
-            } else {
-              setStatus(result.error || "Save failed.");
-            }
+        // One innerHTML write for the whole table (a single reflow).
+        adminTableBody.innerHTML = data.materials
+          .map(
+            (mat) => `<tr>
+            <td>${mat.name_html}</td>
+            <td>${mat.unit_html}</td>
+            <td>${mat.currency_html}</td>
+            <td><input type="number" step="0.01" value="${mat.unit_cost}" data-name="${mat.name_html}" /></td>
+            <td><button class="mini-btn" data-name="${mat.name_html}">Save</button></td>
+          </tr>`
+          )
+          .join("");
+      }
+
+      // A single delegated listener serves every row, including rows added
+      // by later reloads.
+      adminTableBody.addEventListener("click", (e) => {
+        const btn = e.target.closest("button[data-name]");
+        if (!btn) return;
+        const input = btn.closest("tr").querySelector("input[data-name]");
+        queueSave(btn.getAttribute("data-name"), input.value);
+      });
+
+      // Saves clicked in quick succession go out as one bulk request.
+      const pendingSaves = new Map();
+      let saveTimer = null;
+
+      function queueSave(name, unit_cost) {
+        pendingSaves.set(name, unit_cost);
+        setStatus("Saving...");
+        clearTimeout(saveTimer);
+        saveTimer = setTimeout(flushSaves, 400);
+      }
+
+      async function flushSaves() {
+        const updates = Array.from(pendingSaves, ([name, unit_cost]) => ({ name, unit_cost }));
+        pendingSaves.clear();
+        if (!updates.length) return;
+        let result;
+        try {
+          const resp = await fetch("/admin/materials/bulk_update", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ updates })
           });
-        });
+          result = await resp.json();
+        } catch (err) {
+          setStatus("Save failed. Check the connection and try again.");
+          return;
+        }
+        if (result.ok) {
+          setStatus(`Saved ${updates.map((u) => u.name).join(", ")}.`);
+        } else {
+          setStatus(result.error || "Save failed.");
+        }
       }
 
       document.querySelector(".nav-cta").addEventListener("click", (e) => {
@@ -1207,73 +1472,173 @@ def index():
       });
     </script>
     """
-    return page_template("Bakery Quotation", body, show_header=False, body_class="landing-page")
+
+# The landing page has no per-request parts: render (and gzip) it once and let
+# browsers revalidate against a fixed ETag.
+_LANDING_HTML = page_template("Bakery Quotation", _LANDING_BODY, show_header=False, body_class="landing-page")
+_LANDING_PAGE = precompressed(_LANDING_HTML.encode("utf-8"))
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    return precompressed_response(request, _LANDING_PAGE, "text/html", "no-cache")
 
 
 @app.post("/admin/login")
 async def admin_login(request: Request):
-    secret = os.environ.get("ADMIN_PASSWORD", "").strip()
+    secret = ui_settings()["admin_password"]
     if not secret:
-        return JSONResponse({"ok": False, "error": "Admin password not configured"}, status_code=400)
+        return ORJSONResponse({"ok": False, "error": "Admin password not configured"}, status_code=400)
     payload = await request.json()
-    if payload.get("password", "") != secret:
-        return JSONResponse({"ok": False, "error": "Invalid password"}, status_code=401)
-    response = JSONResponse({"ok": True})
+    password = payload.get("password", "")
+    # Constant-time check, on bytes so non-ASCII passwords compare too.
+    if not isinstance(password, str) or not hmac.compare_digest(
+        password.encode("utf-8"), secret.encode("utf-8")
+    ):
+        return ORJSONResponse({"ok": False, "error": "Invalid password"}, status_code=401)
+    response = ORJSONResponse({"ok": True})
+    name, secure = admin_cookie_name(request)
     response.set_cookie(
-        ADMIN_COOKIE_NAME,
+        name,
         admin_token(secret),
+        path="/",
+        secure=secure,
         httponly=True,
-        samesite="lax",
+        samesite="strict",
     )
     return response
 
 
 @app.post("/admin/logout")
 async def admin_logout():
-    response = JSONResponse({"ok": True})
-    response.delete_cookie(ADMIN_COOKIE_NAME)
+    response = ORJSONResponse({"ok": True})
+    response.delete_cookie(ADMIN_COOKIE_NAME, path="/", secure=True, httponly=True, samesite="strict")
+    response.delete_cookie(ADMIN_COOKIE_NAME_HTTP, path="/", httponly=True, samesite="strict")
     return response
 
 
+_ADMIN_DB_STAMP = None
+
+
 @app.get("/admin/materials")
-def admin_materials(request: Request):
+async def admin_materials(request: Request):
+    global _ADMIN_DB_STAMP
     if not admin_cookie_valid(request):
-        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+        return ORJSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
     defaults = get_defaults()
-    return JSONResponse({"ok": True, "materials": list_materials(defaults["materials_db_path"])})
+    db_path = defaults["materials_db_path"]
+    # list_materials is TTL-cached; drop that cache early if the DB file was
+    # changed by another process (migration, sqlite3 shell) since last time.
+    stamp = materials_db_stamp(db_path)
+    if stamp != _ADMIN_DB_STAMP:
+        if _ADMIN_DB_STAMP is not None:
+            clear_material_costs_cache()
+        _ADMIN_DB_STAMP = stamp
+    materials = await asyncio.to_thread(list_materials, db_path)
+    body, etag = admin_materials_payload(materials)
+    # Browsers revalidate on every open (costs can change at any time) and
+    # get a bodyless 304 while the list is unchanged.
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.post("/admin/materials/update")
 async def admin_update_material(request: Request):
     if not admin_cookie_valid(request):
-        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+        return ORJSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
     payload = await request.json()
     name = (payload.get("name") or "").strip()
     unit_cost = payload.get("unit_cost")
     if not name:
-        return JSONResponse({"ok": False, "error": "Missing material name"}, status_code=400)
+        return ORJSONResponse({"ok": False, "error": "Missing material name"}, status_code=400)
     try:
         unit_cost = float(unit_cost)
     except (TypeError, ValueError):
-        return JSONResponse({"ok": False, "error": "Invalid unit_cost"}, status_code=400)
+        return ORJSONResponse({"ok": False, "error": "Invalid unit_cost"}, status_code=400)
     defaults = get_defaults()
-    update_material_cost(defaults["materials_db_path"], name, unit_cost)
-    return JSONResponse({"ok": True})
+    # The write (and its cache invalidation) happens off the event loop.
+    try:
+        await asyncio.to_thread(update_material_cost, defaults["materials_db_path"], name, unit_cost)
+    except ValueError as exc:
+        return ORJSONResponse({"ok": False, "error": str(exc)}, status_code=404)
+    return ORJSONResponse({"ok": True})
+
+
+@app.post("/admin/materials/bulk_update")
+async def admin_bulk_update_materials(request: Request):
+    if not admin_cookie_valid(request):
+        return ORJSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    payload = await request.json()
+    updates = payload.get("updates")
+    if not isinstance(updates, list) or not updates:
+        return ORJSONResponse({"ok": False, "error": "Missing updates"}, status_code=400)
+    items = []
+    for update in updates:
+        if not isinstance(update, dict):
+            return ORJSONResponse({"ok": False, "error": "Invalid update"}, status_code=400)
+        name = (update.get("name") or "").strip()
+        if not name:
+            return ORJSONResponse({"ok": False, "error": "Missing material name"}, status_code=400)
+        try:
+            unit_cost = float(update.get("unit_cost"))
+        except (TypeError, ValueError):
+            return ORJSONResponse({"ok": False, "error": f"Invalid unit_cost for {name}"}, status_code=400)
+        items.append((name, unit_cost))
+    defaults = get_defaults()
+    # All edits land in one transaction (or one Mongo bulk_write).
+    try:
+        await asyncio.to_thread(update_material_costs, defaults["materials_db_path"], items)
+    except ValueError as exc:
+        return ORJSONResponse({"ok": False, "error": str(exc)}, status_code=404)
+    return ORJSONResponse({"ok": True, "updated": len(items)})
+
+
+# The script URLs are not versioned, so keep the freshness window short;
+# after it lapses, browsers revalidate against the ETag and get a 304.
+_ASSET_CACHE_CONTROL = "public, max-age=3600"
+
+
+_JS_ASSETS = ("three.r134.min.js", "vanta.waves.min.js")
+
+
+# Read and compressed once, then served from memory: no open/stat or
+# per-request compression.
+@functools.lru_cache(maxsize=8)
+def js_asset(filename):
+    with open(filename, "rb") as fh:
+        return precompressed(fh.read())
+
+
+def js_asset_response(request, filename):
+    return precompressed_response(
+        request, js_asset(filename), "application/javascript", _ASSET_CACHE_CONTROL
+    )
 
 
 @app.get("/three.r134.min.js")
-def three_js():
-    return FileResponse("three.r134.min.js", media_type="application/javascript")
+async def three_js(request: Request):
+    return js_asset_response(request, "three.r134.min.js")
 
 
 @app.get("/vanta.waves.min.js")
-def vanta_waves_js():
-    return FileResponse("vanta.waves.min.js", media_type="application/javascript")
+async def vanta_waves_js(request: Request):
+    return js_asset_response(request, "vanta.waves.min.js")
 
 
-@app.get("/chat", response_class=HTMLResponse)
-def chat():
-    body = """
+@app.on_event("startup")
+async def warm_js_assets():
+    # Level-9 gzip of ~600 KB takes a while; do it off the event loop before
+    # the first request instead of inside it.
+    for filename in _JS_ASSETS:
+        try:
+            await asyncio.to_thread(js_asset, filename)
+        except OSError as exc:
+            print(f"[assets] {filename} not loaded: {exc}")
+
+
+_CHAT_BODY = """
     <div class="chat">
       <div class="messages" id="messages"></div>
       <div class="chat-input">
@@ -1297,15 +1662,16 @@ def chat():
         messagesEl.scrollTop = messagesEl.scrollHeight;
       }
 
+      const HTML_ESCAPES = { "&": "&amp;", "<": "&lt;", ">": "&gt;" };
+
       function formatMessage(text) {
-        const escaped = text
-          .replace(/&/g, "&amp;")
-          .replace(/</g, "&lt;")
-          .replace(/>/g, "&gt;");
-        const bolded = escaped.replace(/\*\*(.+?)\*\*/g, (_, inner) => {
+        // One pass to escape, one to turn **bold** into <strong> and drop
+        // any unpaired ** markers.
+        const escaped = text.replace(/[&<>]/g, (c) => HTML_ESCAPES[c]);
+        return escaped.replace(/\*\*(.+?)\*\*|\*\*/g, (_, inner) => {
+          if (inner === undefined) return "";
           return "<strong>" + inner.replace(/\*\*/g, "") + "</strong>";
         });
-        return bolded.replace(/\*\*/g, "");
       }
 
       function addQuoteLinks(quote) {
@@ -1320,6 +1686,7 @@ def chat():
             <div class="quote-meta">ID: ${quote.quote_id}</div>
             <div class="quote-meta">Total: ${quote.total} ${quote.currency}</div>
             <div class="quote-actions">
+              <a class="btn-link" href="/download_all/${quote.quote_id}">All (.zip)</a>
               <a class="btn-link" href="/download/${quote.md_filename}">Markdown</a>
               <a class="btn-link" href="/download/${quote.txt_filename}">Text</a>
               ${pdfLink}
@@ -1330,6 +1697,34 @@ def chat():
         messagesEl.scrollTop = messagesEl.scrollHeight;
       }
 
+      async function readReplyStream(resp, bubble) {
+        // Events are {"delta": "..."} pieces, then {"done": true, "quote": ...}.
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let reply = "";
+        let quote = null;
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let end;
+          while ((end = buffer.indexOf("\\n\\n")) !== -1) {
+            const event = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            if (!event.startsWith("data: ")) continue;
+            const data = JSON.parse(event.slice(6));
+            if (data.delta) {
+              reply += data.delta;
+              bubble.innerHTML = formatMessage(reply);
+              messagesEl.scrollTop = messagesEl.scrollHeight;
+            }
+            if (data.quote) quote = data.quote;
+          }
+        }
+        return { reply, quote };
+      }
+
       async function sendMessage() {
         const text = inputEl.value.trim();
         if (!text) return;
@@ -1342,9 +1737,10 @@ def chat():
         const resp = await fetch("/api/chat", {
           method: "POST",
           headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ messages: history })
+          body: JSON.stringify({ messages: history, stream: true })
         });
-        const data = await resp.json();
+        const streamed = (resp.headers.get("Content-Type") || "").startsWith("text/event-stream");
+        const data = streamed ? await readReplyStream(resp, thinking) : await resp.json();
         thinking.innerHTML = formatMessage(data.reply || "No response");
         history.push({ role: "assistant", content: thinking.textContent });
         if (data.quote) {
@@ -1362,7 +1758,311 @@ def chat():
       });
     </script>
     """
-    return page_template("Bakery Quotation Chat", body)
+# Like the landing page, the chat shell is static and pre-rendered once.
+_CHAT_HTML = page_template("Bakery Quotation Chat", _CHAT_BODY)
+_CHAT_PAGE = precompressed(_CHAT_HTML.encode("utf-8"))
+
+
+@app.get("/chat", response_class=HTMLResponse)
+async def chat(request: Request):
+    return precompressed_response(request, _CHAT_PAGE, "text/html", "no-cache")
+
+
+# Function tools offered to the model; static, so built once.
+_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "generate_quote",
+            "description": "Generate a bakery quote after user confirmation.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "job_type": {"type": "string"},
+                    "quantity": {"type": "integer"},
+                    "due_date": {"type": "string"},
+                    "company_name": {"type": "string"},
+                    "customer_name": {"type": "string"},
+                    "customer_email": {"type": "string"},
+                    "currency": {"type": "string"},
+                    "labor_rate": {"type": "number"},
+                    "markup_pct": {"type": "number"},
+                    "vat_pct": {"type": "number"},
+                    "notes": {"type": "string"},
+                    "send_email": {"type": "boolean"},
+                    "confirm": {"type": "boolean"},
+                },
+                "required": [
+                    "job_type",
+                    "quantity",
+                    "due_date",
+                    "company_name",
+                    "customer_name",
+                    "customer_email",
+                    "currency",
+                    "vat_pct",
+                ],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "material_lookup",
+            "description": "Look up a material's unit cost, unit, and currency.",
+            "parameters": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "list_materials",
+            "description": "List all materials with unit costs.",
+            "parameters": {"type": "object", "properties": {}},
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "estimate_job",
+            "description": "Estimate job totals and unit price from known fields.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "job_type": {"type": "string"},
+                    "quantity": {"type": "integer"},
+                    "currency": {"type": "string"},
+                    "labor_rate": {"type": "number"},
+                    "markup_pct": {"type": "number"},
+                    "vat_pct": {"type": "number"},
+                },
+                "required": ["job_type", "quantity", "currency"],
+            },
+        },
+    },
+]
+
+
+# Column order of the quotes sheet, shared by the chat and form flows.
+_SHEET_HEADERS = (
+    "timestamp",
+    "quote_id",
+    "quote_date",
+    "valid_until",
+    "company_name",
+    "customer_name",
+    "customer_email",
+    "job_type",
+    "quantity",
+    "due_date",
+    "currency",
+    "labor_rate",
+    "labor_hours",
+    "materials_subtotal",
+    "labor_cost",
+    "subtotal",
+    "markup_pct",
+    "markup_value",
+    "price_before_vat",
+    "vat_pct",
+    "vat_value",
+    "total",
+    "unit_price",
+    "notes",
+    "email_status",
+    "warnings",
+    "quote_md_path",
+    "quote_txt_path",
+    "line_items_json",
+)
+
+
+def build_sheet_row(inputs, result, email_state):
+    summary = result["summary"]
+    return [
+        result["quote_date"],
+        result["quote_id"],
+        result["quote_date"],
+        result["valid_until"],
+        inputs["company_name"],
+        inputs["customer_name"],
+        inputs["customer_email"],
+        inputs["job_type"],
+        inputs["quantity"],
+        inputs["due_date"],
+        inputs["currency"],
+        inputs["labor_rate"],
+        summary["labor_hours"],
+        summary["materials_subtotal"],
+        summary["labor_cost"],
+        summary["subtotal"],
+        f"{inputs['markup_pct']*100:.0f}%",
+        summary["markup_value"],
+        summary["price_before_vat"],
+        f"{inputs['vat_pct']*100:.0f}%",
+        summary["vat_value"],
+        summary["total"],
+        summary["unit_price"],
+        inputs["notes"],
+        email_state,
+        ", ".join(result["warnings"]),
+        result["out_path"],
+        result["out_txt_path"],
+        json_text(result["lines"]),
+    ]
+
+
+def reload_ui_settings():
+    reload_settings()
+    ui_settings.cache_clear()
+    admin_token_digest.cache_clear()
+    print("[config] settings reloaded")
+
+
+@app.on_event("startup")
+async def install_reload_signal():
+    # `kill -HUP <pid>` re-reads .env and the cached settings without a restart.
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_ui_settings)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Not the main thread (e.g. under a test client).
+        pass
+
+
+# Quotes are logged to Sheets in batches: rows are queued by chat_api and
+# /quote and appended (one API call per sheet) every few seconds, as soon as
+# a batch fills, and once more on shutdown. Rows whose append fails are
+# spilled to disk and re-queued on the next startup.
+_SHEET_QUEUE = collections.deque()
+_SHEET_FLUSH_SECONDS = 5
+_SHEET_BATCH_SIZE = 20
+_SHEET_FLUSHER = None
+_SHEET_WAKE = None
+_SHEET_LOOP = None
+# Failed appends go back on the queue and are retried after a growing delay.
+_SHEET_RETRY_MAX_SECONDS = 300
+_SHEET_BACKOFF = 0
+_SHEET_RETRY_AT = 0.0
+
+
+def queue_sheet_row(settings, row):
+    # Safe from worker threads as well as the event loop.
+    _SHEET_QUEUE.append((settings, row))
+    if len(_SHEET_QUEUE) >= _SHEET_BATCH_SIZE and _SHEET_WAKE is not None:
+        _SHEET_LOOP.call_soon_threadsafe(_SHEET_WAKE.set)
+
+
+def sheet_spill_path():
+    return os.path.join(get_defaults()["output_dir"], "sheet_queue.jsonl")
+
+
+def spill_sheet_rows(settings, rows):
+    path = sheet_spill_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "ab") as fh:
+        fh.write(b"".join(dumps({"settings": settings, "row": row}) + b"\n" for row in rows))
+
+
+def load_sheet_spill():
+    path = sheet_spill_path()
+    # Claim the file by renaming it, so only one of several workers re-queues it.
+    claimed = f"{path}.{os.getpid()}"
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return
+    with open(claimed, "rb") as fh:
+        lines = fh.read().splitlines()
+    entries, bad = [], []
+    for line in lines:
+        if not line:
+            continue
+        # A crash mid-append can leave a truncated last line.
+        try:
+            entry = loads(line)
+            entries.append((entry["settings"], entry["row"]))
+        except (ValueError, KeyError, TypeError):
+            bad.append(line)
+    if bad:
+        with open(path + ".bad", "ab") as fh:
+            fh.write(b"".join(line + b"\n" for line in bad))
+        print(f"[sheets] {len(bad)} unreadable row(s) moved to {path}.bad")
+    _SHEET_QUEUE.extend(entries)
+    os.remove(claimed)
+    print(f"[sheets] re-queued {len(entries)} row(s) from {path}")
+
+
+def flush_sheet_queue(final=False):
+    global _SHEET_BACKOFF, _SHEET_RETRY_AT
+    batches = {}
+    while _SHEET_QUEUE:
+        settings, row = _SHEET_QUEUE.popleft()
+        key = (settings["sheet_id"], settings["tab"], settings["creds_path"])
+        batches.setdefault(key, (settings, []))[1].append(row)
+    failed = []
+    for settings, rows in batches.values():
+        try:
+            append_quotes_to_sheet(settings, _SHEET_HEADERS, rows)
+        except Exception as exc:
+            print(f"[sheets] failed to append {len(rows)} row(s), kept for retry: {exc}")
+            failed.append((settings, rows))
+    if not failed:
+        _SHEET_BACKOFF = 0
+        return
+    if final:
+        # Shutting down: keep the rows on disk for the next start.
+        for settings, rows in failed:
+            try:
+                spill_sheet_rows(settings, rows)
+            except OSError as exc:
+                print(f"[sheets] could not save {len(rows)} row(s), dropped: {exc}")
+        return
+    # Back to the front of the queue, ahead of rows queued meanwhile.
+    for settings, rows in reversed(failed):
+        _SHEET_QUEUE.extendleft((settings, row) for row in reversed(rows))
+    _SHEET_BACKOFF = min(max(_SHEET_BACKOFF * 2, _SHEET_FLUSH_SECONDS), _SHEET_RETRY_MAX_SECONDS)
+    _SHEET_RETRY_AT = time.monotonic() + _SHEET_BACKOFF
+
+
+async def _sheet_flusher():
+    while True:
+        try:
+            await asyncio.wait_for(_SHEET_WAKE.wait(), _SHEET_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _SHEET_WAKE.clear()
+        if _SHEET_QUEUE and time.monotonic() >= _SHEET_RETRY_AT:
+            # One bad flush must not end the task.
+            try:
+                await asyncio.to_thread(flush_sheet_queue)
+            except Exception as exc:
+                print(f"[sheets] flush failed: {exc}")
+
+
+@app.on_event("startup")
+async def start_sheet_flusher():
+    global _SHEET_FLUSHER, _SHEET_WAKE, _SHEET_LOOP
+    _SHEET_LOOP = asyncio.get_running_loop()
+    _SHEET_WAKE = asyncio.Event()
+    try:
+        await asyncio.to_thread(load_sheet_spill)
+    except Exception as exc:
+        print(f"[sheets] could not re-queue saved rows: {exc}")
+    _SHEET_FLUSHER = asyncio.create_task(_sheet_flusher())
+
+
+@app.on_event("shutdown")
+async def stop_sheet_flusher():
+    if _SHEET_FLUSHER is not None:
+        _SHEET_FLUSHER.cancel()
+    if _SHEET_QUEUE:
+        await asyncio.to_thread(flush_sheet_queue, True)
 
 
 @app.post("/api/chat")
@@ -1372,18 +2072,17 @@ async def chat_api(request: Request):
     send_email = False
 
     defaults = get_defaults()
-    job_types = fetch_job_types(defaults["bom_api_url"]) or ["cupcakes", "cake", "pastry_box"]
-    try:
-        fx_rates = load_fx_rates()
-    except ValueError:
-        fx_rates = {}
-    system = {"role": "system", "content": chat_system_prompt(job_types, fx_rates)}
+    # Everything below that touches the BOM API, the materials store, the
+    # filesystem, SMTP or Sheets blocks, so it runs in worker threads.
+    job_types = await asyncio.to_thread(fetch_job_types, defaults["bom_api_url"])
+    job_types = job_types or ["cupcakes", "cake", "pastry_box"]
 
-    user_text = last_user_message(messages)
-    assistant_text = last_assistant_message(messages)
+    user_text, assistant_text = last_messages(messages)
     if user_text and assistant_text and assistant_requested_due_date(assistant_text):
-        today = validation_today()
-        normalized = normalize_due_date_text(user_text, today)
+        # Date helpers may call out to WorldTimeAPI or the date service; keep
+        # that off the event loop.
+        today = await asyncio.to_thread(validation_today)
+        normalized = await asyncio.to_thread(normalize_due_date_text, user_text, today)
         if normalized:
             try:
                 normalized_date = dt.date.fromisoformat(normalized)
@@ -1391,15 +2090,15 @@ async def chat_api(request: Request):
                 normalized_date = None
             if normalized_date:
                 if normalized_date < today:
-                    return JSONResponse(
+                    return ORJSONResponse(
                         {
                             "reply": (
                                 "That date is in the past. Please provide a future date in YYYY-MM-DD."
                             )
                         }
                     )
-                if not validate_due_date_via_api(normalized_date):
-                    return JSONResponse(
+                if not await asyncio.to_thread(validate_due_date_via_api, normalized_date):
+                    return ORJSONResponse(
                         {
                             "reply": (
                                 "I couldn't validate that date with the date service. "
@@ -1407,18 +2106,18 @@ async def chat_api(request: Request):
                             )
                         }
                     )
-                return JSONResponse({"reply": f"Got it — {normalized}. Is that correct?"})
-        return JSONResponse({"reply": "Please provide the due date in YYYY-MM-DD format."})
+                return ORJSONResponse({"reply": f"Got it — {normalized}. Is that correct?"})
+        return ORJSONResponse({"reply": "Please provide the due date in YYYY-MM-DD format."})
     if user_text and assistant_text and assistant_requested_email(assistant_text):
         email = user_text.strip()
         api_result = validate_email_via_api(email)
         if api_result is True or (api_result is None and validate_email_locally(email)):
-            return JSONResponse({"reply": "Thanks! What currency should I use for the quote?"})
-        return JSONResponse({"reply": "Please provide a valid email address (name@domain.tld)."})
+            return ORJSONResponse({"reply": "Thanks! What currency should I use for the quote?"})
+        return ORJSONResponse({"reply": "Please provide a valid email address (name@domain.tld)."})
     if user_text:
         lowered = user_text.lower()
         mats = None
-        if "price" in lowered or "cost" in lowered or "how much" in lowered:
+        if _PRICE_RE.search(lowered):
             job_type = extract_job_type(user_text, job_types) or extract_job_type_from_messages(
                 messages, job_types
             )
@@ -1433,20 +2132,20 @@ async def chat_api(request: Request):
                     "vat_pct": defaults["vat_pct"],
                 }
                 try:
-                    _, summary = compute_costs(inputs, defaults)
+                    _, summary = await asyncio.to_thread(compute_costs, inputs, defaults)
                     reply = (
                         f"Estimated unit price for {quantity} {job_type}: "
                         f"{summary['unit_price']} {inputs['currency']}."
                     )
-                    return JSONResponse({"reply": reply})
+                    return ORJSONResponse({"reply": reply})
                 except Exception as exc:
-                    return JSONResponse({"reply": f"Pricing estimate failed: {exc}"})
-            mats = list_materials(defaults["materials_db_path"])
+                    return ORJSONResponse({"reply": f"Pricing estimate failed: {exc}"})
+            mats = await asyncio.to_thread(list_materials, defaults["materials_db_path"])
             mat_name = find_material_in_text(user_text, mats)
             if mat_name:
-                mat = get_material(defaults["materials_db_path"], mat_name)
+                mat = await asyncio.to_thread(get_material, defaults["materials_db_path"], mat_name)
                 if mat:
-                    return JSONResponse(
+                    return ORJSONResponse(
                         {
                             "reply": (
                                 f"{mat['name']} costs {mat['unit_cost']} {mat['currency']} "
@@ -1455,89 +2154,21 @@ async def chat_api(request: Request):
                         }
                     )
 
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "generate_quote",
-                "description": "Generate a bakery quote after user confirmation.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "job_type": {"type": "string"},
-                        "quantity": {"type": "integer"},
-                        "due_date": {"type": "string"},
-                        "company_name": {"type": "string"},
-                        "customer_name": {"type": "string"},
-                        "customer_email": {"type": "string"},
-                        "currency": {"type": "string"},
-                        "labor_rate": {"type": "number"},
-                        "markup_pct": {"type": "number"},
-                        "vat_pct": {"type": "number"},
-                        "notes": {"type": "string"},
-                        "send_email": {"type": "boolean"},
-                        "confirm": {"type": "boolean"},
-                    },
-                    "required": [
-                        "job_type",
-                        "quantity",
-                        "due_date",
-                        "company_name",
-                        "customer_name",
-                        "customer_email",
-                        "currency",
-                        "vat_pct",
-                    ],
-                },
-            },
-        }
-        ,
-        {
-            "type": "function",
-            "function": {
-                "name": "material_lookup",
-                "description": "Look up a material's unit cost, unit, and currency.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {"name": {"type": "string"}},
-                    "required": ["name"],
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "list_materials",
-                "description": "List all materials with unit costs.",
-                "parameters": {"type": "object", "properties": {}},
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "estimate_job",
-                "description": "Estimate job totals and unit price from known fields.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "job_type": {"type": "string"},
-                        "quantity": {"type": "integer"},
-                        "currency": {"type": "string"},
-                        "labor_rate": {"type": "number"},
-                        "markup_pct": {"type": "number"},
-                        "vat_pct": {"type": "number"},
-                    },
-                    "required": ["job_type", "quantity", "currency"],
-                },
-            },
-        },
-    ]
+
+    # Only turns that reach the model need the FX rates and system prompt.
+    try:
+        fx_rates = await asyncio.to_thread(load_fx_rates)
+    except ValueError:
+        fx_rates = {}
+    system = {"role": "system", "content": chat_system_prompt(job_types, fx_rates)}
 
     try:
-        resp = mistral_chat([system] + messages, tools=tools, tool_choice="auto")
+        resp = await asyncio.to_thread(
+            mistral_chat, [system, *messages], tools=_TOOLS, tool_choice="auto"
+        )
         msg = resp["choices"][0]["message"]
     except Exception as exc:
-        return JSONResponse({"reply": f"Error: {exc}"}, status_code=200)
+        return ORJSONResponse({"reply": f"Error: {exc}"}, status_code=200)
 
     if msg.get("tool_calls"):
         tool_messages = []
@@ -1546,25 +2177,27 @@ async def chat_api(request: Request):
         for tool in msg["tool_calls"]:
             name = tool["function"]["name"]
             try:
-                args = json.loads(tool["function"]["arguments"] or "{}")
-            except json.JSONDecodeError:
+                args = loads(tool["function"]["arguments"] or "{}")
+            except JSONDecodeError:
                 args = {}
 
             if name == "material_lookup":
-                material = get_material(defaults["materials_db_path"], args.get("name", ""))
+                material = await asyncio.to_thread(
+                    get_material, defaults["materials_db_path"], args.get("name", "")
+                )
                 tool_messages.append(
                     {
                         "role": "tool",
                         "tool_call_id": tool["id"],
-                        "content": json.dumps(material or {"error": "Material not found"}),
+                        "content": json_text(material or {"error": "Material not found"}),
                     }
                 )
                 continue
 
             if name == "list_materials":
-                mats = list_materials(defaults["materials_db_path"])
+                mats = await asyncio.to_thread(list_materials, defaults["materials_db_path"])
                 tool_messages.append(
-                    {"role": "tool", "tool_call_id": tool["id"], "content": json.dumps(mats)}
+                    {"role": "tool", "tool_call_id": tool["id"], "content": json_text(mats)}
                 )
                 continue
 
@@ -1583,12 +2216,12 @@ async def chat_api(request: Request):
                     "vat_pct": parse_pct(float(args.get("vat_pct", defaults["vat_pct"] * 100))),
                 }
                 try:
-                    lines, summary = compute_costs(inputs, defaults)
+                    lines, summary = await asyncio.to_thread(compute_costs, inputs, defaults)
                     content = {"summary": summary, "lines": lines}
                 except Exception as exc:
                     content = {"error": str(exc)}
                 tool_messages.append(
-                    {"role": "tool", "tool_call_id": tool["id"], "content": json.dumps(content)}
+                    {"role": "tool", "tool_call_id": tool["id"], "content": json_text(content)}
                 )
                 continue
 
@@ -1598,7 +2231,7 @@ async def chat_api(request: Request):
                     quantity = int(qty_raw)
                 except (TypeError, ValueError):
                     quantity = 0
-                resolved_due = resolve_due_date(args.get("due_date", ""))
+                resolved_due = await asyncio.to_thread(resolve_due_date, args.get("due_date", ""))
                 inputs = {
                     "job_type": args.get("job_type"),
                     "quantity": quantity,
@@ -1616,13 +2249,13 @@ async def chat_api(request: Request):
                 confirmed = bool(args.get("confirm", False))
 
                 try:
-                    lines, summary = compute_costs(inputs, defaults)
+                    lines, summary = await asyncio.to_thread(compute_costs, inputs, defaults)
                 except Exception as exc:
                     tool_messages.append(
                         {
                             "role": "tool",
                             "tool_call_id": tool["id"],
-                            "content": json.dumps({"error": str(exc)}),
+                            "content": json_text({"error": str(exc)}),
                         }
                     )
                     continue
@@ -1639,7 +2272,7 @@ async def chat_api(request: Request):
                         {
                             "role": "tool",
                             "tool_call_id": tool["id"],
-                            "content": json.dumps(
+                            "content": json_text(
                                 {
                                     "summary": summary,
                                     "currency": inputs["currency"],
@@ -1650,7 +2283,9 @@ async def chat_api(request: Request):
                     )
                     continue
 
-                result = build_quote(inputs, defaults, lines=lines, summary=summary)
+                result = await asyncio.to_thread(
+                    build_quote, inputs, defaults, lines=lines, summary=summary
+                )
 
                 email_state = "skipped"
                 if send_email:
@@ -1669,7 +2304,8 @@ async def chat_api(request: Request):
                             f"Regards,\n{defaults['sender_name']}\n"
                         )
                         try:
-                            send_quote_email(
+                            await asyncio.to_thread(
+                                send_quote_email,
                                 settings,
                                 inputs["customer_email"],
                                 subject,
@@ -1682,72 +2318,9 @@ async def chat_api(request: Request):
 
                 sheet_settings = sheets_settings()
                 if sheet_settings is not None:
-                    headers = [
-                        "timestamp",
-                        "quote_id",
-                        "quote_date",
-                        "valid_until",
-                        "company_name",
-                        "customer_name",
-                        "customer_email",
-                        "job_type",
-                        "quantity",
-                        "due_date",
-                        "currency",
-                        "labor_rate",
-                        "labor_hours",
-                        "materials_subtotal",
-                        "labor_cost",
-                        "subtotal",
-                        "markup_pct",
-                        "markup_value",
-                        "price_before_vat",
-                        "vat_pct",
-                        "vat_value",
-                        "total",
-                        "unit_price",
-                        "notes",
-                        "email_status",
-                        "warnings",
-                        "quote_md_path",
-                        "quote_txt_path",
-                        "line_items_json",
-                    ]
-                    row = [
-                        result["quote_date"],
-                        result["quote_id"],
-                        result["quote_date"],
-                        result["valid_until"],
-                        inputs["company_name"],
-                        inputs["customer_name"],
-                        inputs["customer_email"],
-                        inputs["job_type"],
-                        inputs["quantity"],
-                        inputs["due_date"],
-                        inputs["currency"],
-                        inputs["labor_rate"],
-                        result["summary"]["labor_hours"],
-                        result["summary"]["materials_subtotal"],
-                        result["summary"]["labor_cost"],
-                        result["summary"]["subtotal"],
-                        f"{inputs['markup_pct']*100:.0f}%",
-                        result["summary"]["markup_value"],
-                        result["summary"]["price_before_vat"],
-                        f"{inputs['vat_pct']*100:.0f}%",
-                        result["summary"]["vat_value"],
-                        result["summary"]["total"],
-                        result["summary"]["unit_price"],
-                        inputs["notes"],
-                        email_state,
-                        ", ".join(result["warnings"]),
-                        result["out_path"],
-                        result["out_txt_path"],
-                        json.dumps(result["lines"]),
-                    ]
-                    try:
-                        append_quote_to_sheet(sheet_settings, headers, row)
-                    except Exception:
-                        pass
+                    row = build_sheet_row(inputs, result, email_state)
+                    # Logged by the background flusher, off the reply path.
+                    queue_sheet_row(sheet_settings, row)
 
                 tool_result = {
                     "quote_id": result["quote_id"],
@@ -1762,7 +2335,7 @@ async def chat_api(request: Request):
                     {
                         "role": "tool",
                         "tool_call_id": tool["id"],
-                        "content": json.dumps(tool_result),
+                        "content": json_text(tool_result),
                     }
                 )
                 quote_payload = {
@@ -1792,31 +2365,94 @@ async def chat_api(request: Request):
             if preview_payload["warnings"]:
                 reply_lines.append("Warnings:")
                 reply_lines.extend(f"- {warning}" for warning in preview_payload["warnings"])
-            return JSONResponse({"reply": "\n".join(reply_lines)})
+            return ORJSONResponse({"reply": "\n".join(reply_lines)})
+
+        if payload.get("stream"):
+            # identity keeps GZipMiddleware from buffering the event stream.
+            return StreamingResponse(
+                follow_up_events([system, *messages, msg, *tool_messages], quote_payload),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"},
+            )
 
         try:
-            follow = mistral_chat([system] + messages + [msg] + tool_messages)
+            follow = await asyncio.to_thread(mistral_chat, [system, *messages, msg, *tool_messages])
             reply = follow["choices"][0]["message"]["content"]
         except Exception:
             reply = "Done. Let me know if you need anything else."
 
-        return JSONResponse({"reply": reply, "quote": quote_payload} if quote_payload else {"reply": reply})
+        return ORJSONResponse({"reply": reply, "quote": quote_payload} if quote_payload else {"reply": reply})
 
     content = msg.get("content", "")
-    lowered = content.lower()
-    if "model" in lowered and ("mistral" in lowered or "codestral" in lowered):
+    if not _REPLY_TRIGGER_ANY_RE.search(content):
+        return ORJSONResponse({"reply": content})
+    found = {match.lower() for match in _REPLY_TRIGGER_RE.findall(content)}
+    if "model" in found and ("mistral" in found or "codestral" in found):
         content = "I’m focused on helping with your quote. What would you like to order?"
-    if "command:download_file" in lowered or "[markdown]" in lowered or "[text]" in lowered or "[pdf]" in lowered:
+    if found & {"command:download_file", "[markdown]", "[text]", "[pdf]"}:
         content = "Your quote is ready. Use the download buttons below."
-    if "only assist" in lowered and "2023" in lowered:
+    if "only assist" in found and "2023" in found:
         content = "Thanks! I’ve noted the date. What quantity do you need, and which item should I quote?"
-    if "last update" in lowered or "knowledge cutoff" in lowered:
+    if "last update" in found or "knowledge cutoff" in found:
         content = "Got it. What date should I set for the order, and what quantity do you need?"
-    return JSONResponse({"reply": content})
+    return ORJSONResponse({"reply": content})
+
+
+def quote_status_path(quote_id):
+    return os.path.join(get_defaults()["output_dir"], f"{os.path.basename(quote_id)}.status.json")
+
+
+def write_quote_status(quote_id, status):
+    with open(quote_status_path(quote_id), "wb") as fh:
+        fh.write(dumps(status))
+
+
+def deliver_quote(defaults, inputs, result, status, email_settings, sheet_settings):
+    # Background half of /quote: send the email, then queue the Sheets row
+    # (it records the email outcome) and update the status file.
+    summary = result["summary"]
+    if email_settings is not None:
+        subject = f"Quotation {result['quote_id']} from {defaults['sender_name']}"
+        body = (
+            f"Hello {inputs['customer_name']},\n\n"
+            f"Thank you for your order. Please find your quotation attached.\n\n"
+            f"Quote ID: {result['quote_id']}\n"
+            f"Project: {inputs['job_type']} x {inputs['quantity']}\n"
+            f"Due date: {inputs['due_date']}\n"
+            f"Total: {summary['total']} {inputs['currency']}\n\n"
+            f"Regards,\n"
+            f"{defaults['sender_name']}\n"
+        )
+        try:
+            send_quote_email(
+                email_settings,
+                inputs["customer_email"],
+                subject,
+                body,
+                [result["out_path"], result["out_txt_path"], result["out_pdf_path"]],
+            )
+            status["email"] = "sent"
+        except Exception as exc:
+            status["email"] = f"failed: {exc.__class__.__name__}"
+            print(f"[email] quote {result['quote_id']} not sent: {exc}")
+    if sheet_settings is not None:
+        row = build_sheet_row(inputs, result, status["email"])
+        queue_sheet_row(sheet_settings, row)
+    write_quote_status(result["quote_id"], status)
+
+
+_ERROR_BODY = """
+<h2>Something went wrong</h2>
+<p>{}</p>
+<div class="actions">
+  <a href="/"><button type="button">Back</button></a>
+</div>
+"""
 
 
 @app.post("/quote", response_class=HTMLResponse)
-def quote(
+async def quote(
+    background_tasks: BackgroundTasks,
     job_type: str = Form(...),
     quantity: int = Form(...),
     due_date: str = Form(""),
@@ -1830,179 +2466,153 @@ def quote(
     notes: str = Form(""),
     send_email: str = Form("on"),
 ):
+    # FastAPI has already coerced the numeric fields (pydantic-core) from the
+    # annotations above, so they are used as-is.
     defaults = get_defaults()
     if not due_date:
         due_date = "TBD"
 
     inputs = {
         "job_type": job_type,
-        "quantity": int(quantity),
+        "quantity": quantity,
         "due_date": due_date,
         "company_name": company_name,
         "customer_name": customer_name,
         "customer_email": customer_email,
         "currency": currency,
-        "labor_rate": float(labor_rate),
-        "markup_pct": parse_pct(float(markup_pct)),
-        "vat_pct": parse_pct(float(vat_pct)),
+        "labor_rate": labor_rate,
+        "markup_pct": parse_pct(markup_pct),
+        "vat_pct": parse_pct(vat_pct),
         "notes": notes or "Please confirm delivery details.",
     }
 
     try:
-        result = build_quote(inputs, defaults)
-        summary = result["summary"]
-        markdown = html.escape(result["markdown"])
-        filename = os.path.basename(result["out_path"])
-        txt_filename = os.path.basename(result["out_txt_path"])
-        email_status = ""
-        email_state = "skipped"
-        if send_email:
-            settings = smtp_settings()
-            if settings is None:
-                email_status = "<div class=\"pill\">Email not sent: SMTP_HOST not configured.</div>"
-                email_state = "not_configured"
-            else:
-                subject = f"Quotation {result['quote_id']} from {defaults['sender_name']}"
-                body = (
-                    f"Hello {inputs['customer_name']},\n\n"
-                    f"Thank you for your order. Please find your quotation attached.\n\n"
-                    f"Quote ID: {result['quote_id']}\n"
-                    f"Project: {inputs['job_type']} x {inputs['quantity']}\n"
-                    f"Due date: {inputs['due_date']}\n"
-                    f"Total: {summary['total']} {inputs['currency']}\n\n"
-                    f"Regards,\n"
-                    f"{defaults['sender_name']}\n"
-                )
-                try:
-                    send_quote_email(
-                        settings,
-                        inputs["customer_email"],
-                        subject,
-                        body,
-                        [result["out_path"], result["out_txt_path"], result["out_pdf_path"]],
-                    )
-                    email_status = "<div class=\"pill\">Email sent to customer.</div>"
-                    email_state = "sent"
-                except Exception as exc:
-                    err = html.escape(f"{exc.__class__.__name__}: {exc}")
-                    email_status = f"<div class=\"pill\">Email failed: {err}</div>"
-                    email_state = f"failed: {exc.__class__.__name__}"
-
-        sheets_status = ""
-        sheet_settings = sheets_settings()
-        if sheet_settings is not None:
-            headers = [
-                "timestamp",
-                "quote_id",
-                "quote_date",
-                "valid_until",
-                "company_name",
-                "customer_name",
-                "customer_email",
-                "job_type",
-                "quantity",
-                "due_date",
-                "currency",
-                "labor_rate",
-                "labor_hours",
-                "materials_subtotal",
-                "labor_cost",
-                "subtotal",
-                "markup_pct",
-                "markup_value",
-                "price_before_vat",
-                "vat_pct",
-                "vat_value",
-                "total",
-                "unit_price",
-                "notes",
-                "email_status",
-                "warnings",
-                "quote_md_path",
-                "quote_txt_path",
-                "line_items_json",
-            ]
-            row = [
-                result["quote_date"],
-                result["quote_id"],
-                result["quote_date"],
-                result["valid_until"],
-                inputs["company_name"],
-                inputs["customer_name"],
-                inputs["customer_email"],
-                inputs["job_type"],
-                inputs["quantity"],
-                inputs["due_date"],
-                inputs["currency"],
-                inputs["labor_rate"],
-                summary["labor_hours"],
-                summary["materials_subtotal"],
-                summary["labor_cost"],
-                summary["subtotal"],
-                f"{inputs['markup_pct']*100:.0f}%",
-                summary["markup_value"],
-                summary["price_before_vat"],
-                f"{inputs['vat_pct']*100:.0f}%",
-                summary["vat_value"],
-                summary["total"],
-                summary["unit_price"],
-                inputs["notes"],
-                email_state,
-                ", ".join(result["warnings"]),
-                result["out_path"],
-                result["out_txt_path"],
-                json.dumps(result["lines"]),
-            ]
-            try:
-                append_quote_to_sheet(sheet_settings, headers, row)
-                sheets_status = "<div class=\"pill\">Logged to Google Sheet.</div>"
-            except Exception as exc:
-                err = html.escape(f"{exc.__class__.__name__}: {exc}")
-                sheets_status = f"<div class=\"pill\">Sheet log failed: {err}</div>"
-        warnings = "".join(f"<div class=\"pill\">{html.escape(w)}</div>" for w in result["warnings"])
-        body = f"""
-        <h2>Quote ready</h2>
-        <p>Quote ID: <strong>{html.escape(result['quote_id'])}</strong></p>
-        <div class="summary">
-          <div class="stat"><strong>Total</strong><br />{summary['total']} {html.escape(currency)}</div>
-          <div class="stat"><strong>Unit price</strong><br />{summary['unit_price']} {html.escape(currency)}</div>
-          <div class="stat"><strong>Materials</strong><br />{summary['materials_subtotal']} {html.escape(currency)}</div>
-        </div>
-        <div class="actions" style="margin-top:12px;">
-          <a href="/download/{html.escape(filename)}"><button type="button">Download Markdown</button></a>
-          <a href="/download/{html.escape(txt_filename)}"><button type="button" style="background:var(--accent-2);">Download Text</button></a>
-          <a href="/download/{html.escape(pdf_filename)}"><button type="button" style="background:#8b6f5a;">Download PDF</button></a>
-          <a href="/"><button type="button" style="background:var(--accent-2);">New Quote</button></a>
-        </div>
-        {email_status}
-        {sheets_status}
-        {warnings}
-        <h3>Preview (Markdown)</h3>
-        <pre>{markdown}</pre>
-        """
-        return page_template("Quote Ready", body)
+        result = await asyncio.to_thread(build_quote, inputs, defaults)
+    except (ValueError, KeyError, OSError, RuntimeError) as exc:
+        return page_template("Error", _ERROR_BODY.format(html.escape(str(exc))))
     except Exception as exc:
-        body = f"""
-        <h2>Something went wrong</h2>
-        <p>{html.escape(str(exc))}</p>
-        <div class="actions">
-          <a href="/"><button type="button">Back</button></a>
-        </div>
-        """
-        return page_template("Error", body)
+        # Driver errors (e.g. PyMongoError) and anything unexpected: log the
+        # detail, show the generic error page rather than a bare 500.
+        print(f"[quote] build failed: {exc.__class__.__name__}: {exc}")
+        return page_template("Error", _ERROR_BODY.format("The quote could not be built. Please try again."))
+
+    summary = result["summary"]
+    markdown = html.escape(result["markdown"])
+    filename = os.path.basename(result["out_path"])
+    txt_filename = os.path.basename(result["out_txt_path"])
+    pdf_filename = os.path.basename(result["out_pdf_path"])
+    email_state = "skipped"
+    email_settings = None
+    if send_email:
+        email_settings = smtp_settings()
+        email_state = "queued" if email_settings is not None else "not_configured"
+    sheet_settings = sheets_settings()
+    status = {
+        "quote_id": result["quote_id"],
+        "email": email_state,
+        "sheet": "queued" if sheet_settings is not None else "disabled",
+    }
+    try:
+        await asyncio.to_thread(write_quote_status, result["quote_id"], status)
+    except OSError as exc:
+        # The quote files exist already; a missing status file only affects
+        # the status link, so keep going.
+        print(f"[quote] status for {result['quote_id']} not written: {exc}")
+    if email_settings is not None or sheet_settings is not None:
+        # Email and Sheets logging run after the page is sent.
+        background_tasks.add_task(deliver_quote, defaults, inputs, result, status, email_settings, sheet_settings)
+
+    quote_id = _esc(result["quote_id"])
+    status_link = f"<a href=\"/quote/{quote_id}/status\">status</a>"
+    email_status = ""
+    if email_state == "not_configured":
+        email_status = "<div class=\"pill\">Email not sent: SMTP_HOST not configured.</div>"
+    elif email_state == "queued":
+        email_status = f"<div class=\"pill\">Email queued for sending ({status_link}).</div>"
+    sheets_status = ""
+    if sheet_settings is not None:
+        sheets_status = f"<div class=\"pill\">Queued for Google Sheet ({status_link}).</div>"
+    warnings = "".join(f"<div class=\"pill\">{_esc(w)}</div>" for w in result["warnings"])
+    currency_html = _esc(currency)
+    body = f"""
+    <h2>Quote ready</h2>
+    <p>Quote ID: <strong>{quote_id}</strong></p>
+    <div class="summary">
+      <div class="stat"><strong>Total</strong><br />{summary['total']} {currency_html}</div>
+      <div class="stat"><strong>Unit price</strong><br />{summary['unit_price']} {currency_html}</div>
+      <div class="stat"><strong>Materials</strong><br />{summary['materials_subtotal']} {currency_html}</div>
+    </div>
+    <div class="actions" style="margin-top:12px;">
+      <a href="/download_all/{quote_id}"><button type="button">Download all (.zip)</button></a>
+      <a href="/"><button type="button" style="background:var(--accent-2);">New Quote</button></a>
+    </div>
+    <details style="margin-top:12px;">
+      <summary>Individual files</summary>
+      <div class="actions" style="margin-top:8px;">
+        <a href="/download/{_esc(filename)}"><button type="button">Download Markdown</button></a>
+        <a href="/download/{_esc(txt_filename)}"><button type="button" style="background:var(--accent-2);">Download Text</button></a>
+        <a href="/download/{_esc(pdf_filename)}"><button type="button" style="background:#8b6f5a;">Download PDF</button></a>
+      </div>
+    </details>
+    {email_status}
+    {sheets_status}
+    {warnings}
+    <h3>Preview (Markdown)</h3>
+    <pre>{markdown}</pre>
+    """
+    return page_template("Quote Ready", body)
+
+
+@app.get("/quote/{quote_id}/status")
+async def quote_status(quote_id: str):
+    try:
+        with open(quote_status_path(quote_id), "rb") as fh:
+            return Response(fh.read(), media_type="application/json")
+    except FileNotFoundError:
+        return ORJSONResponse({"ok": False, "error": "Unknown quote"}, status_code=404)
+
+
+_DOWNLOAD_NAME_RE = re.compile(r"quote_[\w-]+(?:\.[\w-]+)*\.(?:md|txt|pdf|zip)")
 
 
 @app.get("/download/{filename}")
-def download(filename: str):
+async def download(filename: str):
+    # Only quote artifacts are served; the status files and the Sheets
+    # spill file in the same directory hold other customers' details.
+    if not _DOWNLOAD_NAME_RE.fullmatch(filename):
+        return HTMLResponse("File not found", status_code=404)
     defaults = get_defaults()
     safe_name = os.path.basename(filename)
     path = os.path.join(defaults["output_dir"], safe_name)
-    if not os.path.exists(path):
+    # One stat, off the event loop; FileResponse reuses it for the
+    # Content-Length/ETag instead of stat-ing again.
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except OSError:
+        return HTMLResponse("File not found", status_code=404)
+    if not stat.S_ISREG(stat_result.st_mode):
         return HTMLResponse("File not found", status_code=404)
-    return FileResponse(path, filename=safe_name, media_type="text/markdown")
+    media_type = mimetypes.guess_type(safe_name)[0] or "application/octet-stream"
+    return FileResponse(path, filename=safe_name, media_type=media_type, stat_result=stat_result)
 
 
+@app.get("/download_all/{quote_id}")
+async def download_all(quote_id: str):
+    # The .md/.txt/.pdf bundle build_quote writes alongside them.
+    return await download(f"quote_{os.path.basename(quote_id)}.zip")
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="127.0.0.1", port=8080)
+    # Single process by default: the material-cost/admin caches and the SIGHUP
+    # reload are per process, and uvicorn's multiprocess supervisor does not
+    # forward SIGHUP. UI_WORKERS opts in to more (import-string form needed).
+    # uvloop/httptools are used when installed.
+    uvicorn.run(
+        "ui:app",
+        host="127.0.0.1",
+        port=8080,
+        loop="auto",
+        http="auto",
+        workers=env_int("UI_WORKERS", 1),
+    )